@@ -0,0 +1,107 @@
+"""initial schema
+
+Matches the tables previously created by Base.metadata.create_all. Existing
+databases that already have these tables should be stamped instead:
+`alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-01-15 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("ime", sa.String(), nullable=False),
+        sa.Column("prezime", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("password", sa.String(), nullable=False),
+        sa.Column("account_type", sa.String(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+    )
+    op.create_table(
+        "admin",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("avatar", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(["id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "student",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("baserow_id", sa.Integer(), nullable=False),
+        sa.Column("JMBAG", sa.String(), nullable=False),
+        sa.Column("godina_studija", sa.String(), nullable=True),
+        sa.Column("process_instance_id", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("JMBAG"),
+    )
+    op.create_table(
+        "message",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("sender_id", sa.Integer(), nullable=False),
+        sa.Column("receiver_id", sa.Integer(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column(
+            "timestamp",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["receiver_id"], ["user.id"]),
+        sa.ForeignKeyConstraint(["sender_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "conversation",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_1_id", sa.Integer(), nullable=False),
+        sa.Column("user_2_id", sa.Integer(), nullable=False),
+        sa.Column("user_1_last_message_read_id", sa.Integer(), nullable=True),
+        sa.Column("user_2_last_message_read_id", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("user_1_active", sa.Boolean(), nullable=False),
+        sa.Column("user_2_active", sa.Boolean(), nullable=False),
+        sa.Column(
+            "timestamp",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["user_1_id"], ["user.id"]),
+        sa.ForeignKeyConstraint(["user_2_id"], ["user.id"]),
+        sa.ForeignKeyConstraint(["user_1_last_message_read_id"], ["message.id"]),
+        sa.ForeignKeyConstraint(["user_2_last_message_read_id"], ["message.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_conversation_id", "conversation", ["id"])
+
+
+def downgrade():
+    op.drop_index("ix_conversation_id", table_name="conversation")
+    op.drop_table("conversation")
+    op.drop_table("message")
+    op.drop_table("student")
+    op.drop_table("admin")
+    op.drop_table("user")
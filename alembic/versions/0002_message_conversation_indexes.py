@@ -0,0 +1,53 @@
+"""message and conversation indexes
+
+Composite indexes for the chat queries in app/routers/user.py. They are built
+CONCURRENTLY so existing tables stay writable while the indexes are created.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-01-15 10:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    (
+        "ix_message_sender_id_receiver_id_timestamp",
+        "message",
+        ["sender_id", "receiver_id", "timestamp", "id"],
+    ),
+    ("ix_message_receiver_id", "message", ["receiver_id"]),
+    ("ix_conversation_user_1_id_user_2_id", "conversation", ["user_1_id", "user_2_id"]),
+    ("ix_conversation_user_2_id_user_1_id", "conversation", ["user_2_id", "user_1_id"]),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
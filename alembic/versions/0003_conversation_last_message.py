@@ -0,0 +1,62 @@
+"""conversation last message pointer
+
+Adds conversation.last_message_id / last_message_at, maintained by
+send_message, and backfills them from the newest message exchanged between
+the two users of each conversation.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-01-22 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "conversation", sa.Column("last_message_id", sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        "conversation",
+        sa.Column("last_message_at", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.create_foreign_key(
+        "conversation_last_message_id_fkey",
+        "conversation",
+        "message",
+        ["last_message_id"],
+        ["id"],
+    )
+
+    op.execute(
+        """
+        UPDATE conversation AS c
+        SET last_message_id = last.id, last_message_at = last.timestamp
+        FROM conversation AS c2
+        CROSS JOIN LATERAL (
+            SELECT m.id, m.timestamp
+            FROM message AS m
+            WHERE (m.sender_id = c2.user_1_id AND m.receiver_id = c2.user_2_id)
+               OR (m.sender_id = c2.user_2_id AND m.receiver_id = c2.user_1_id)
+            ORDER BY m.timestamp DESC, m.id DESC
+            LIMIT 1
+        ) AS last
+        WHERE c.id = c2.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_constraint(
+        "conversation_last_message_id_fkey", "conversation", type_="foreignkey"
+    )
+    op.drop_column("conversation", "last_message_at")
+    op.drop_column("conversation", "last_message_id")
@@ -0,0 +1,70 @@
+"""outbox job table
+
+Adds the outbox_job table drained by app/outbox.py, and makes
+student.baserow_id nullable since it is now filled in after the student row
+is committed.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-02-05 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "outbox_job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column(
+            "status", sa.String(), server_default=sa.text("'pending'"), nullable=False
+        ),
+        sa.Column("attempts", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column(
+            "next_attempt_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("result", postgresql.JSONB(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_outbox_job_status_next_attempt_at",
+        "outbox_job",
+        ["status", "next_attempt_at"],
+    )
+    op.alter_column("student", "baserow_id", existing_type=sa.Integer(), nullable=True)
+
+
+def downgrade():
+    op.alter_column(
+        "student", "baserow_id", existing_type=sa.Integer(), nullable=False
+    )
+    op.drop_index("ix_outbox_job_status_next_attempt_at", table_name="outbox_job")
+    op.drop_table("outbox_job")
@@ -0,0 +1,43 @@
+"""rate limit bucket table
+
+Adds the rate_limit_bucket table used by the shared (Postgres) backend of the
+login rate limiter in app/rate_limit.py.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-02-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "rate_limit_bucket",
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("allowed", sa.Boolean(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text("NOW()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(
+        "ix_rate_limit_bucket_updated_at", "rate_limit_bucket", ["updated_at"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_rate_limit_bucket_updated_at", table_name="rate_limit_bucket")
+    op.drop_table("rate_limit_bucket")
@@ -0,0 +1,67 @@
+"""table version counters
+
+Adds the table_version table and a statement-level trigger on user, student
+and admin that bumps the table's counter on every write. The
+counter is updated in the writing transaction, so it becomes visible together
+with the data and list endpoints can derive their ETag from it.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-02-26 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# Not conversation: it is written on every message, so a table-wide counter
+# would serialise all messages and change every user's tag. Conversations are
+# tagged per user instead (see get_conversations)
+VERSIONED_TABLES = ("user", "student", "admin")
+
+
+def upgrade():
+    op.create_table(
+        "table_version",
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column(
+            "version", sa.BigInteger(), server_default=sa.text("0"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("table_name"),
+    )
+    op.execute(
+        """
+        CREATE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO table_version (table_name, version) VALUES (TG_TABLE_NAME, 1)
+            ON CONFLICT (table_name)
+            DO UPDATE SET version = table_version.version + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table in VERSIONED_TABLES:
+        op.execute(
+            f"INSERT INTO table_version (table_name, version) VALUES ('{table}', 0)"
+        )
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_table_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{table}"
+            FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()
+            """
+        )
+
+
+def downgrade():
+    for table in VERSIONED_TABLES:
+        op.execute(f'DROP TRIGGER {table}_table_version ON "{table}"')
+    op.execute("DROP FUNCTION bump_table_version()")
+    op.drop_table("table_version")
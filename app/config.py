@@ -1,3 +1,5 @@
+from typing import Dict, Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -15,6 +17,89 @@ class Settings(BaseSettings):
     BASEROW_CONNECTOR_URL: str
     BPMN_ENGINE_URL: str
 
+    # Per worker process, for each of the sync and the async engine
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    # POSTGRES_HOSTNAME points at PgBouncer in transaction pooling mode
+    DB_PGBOUNCER: bool = False
+    # Postgres itself, for LISTEN and migrations, which need a session of
+    # their own. Defaults to POSTGRES_HOSTNAME
+    POSTGRES_DIRECT_HOSTNAME: Optional[str] = None
+    # Read replica for read-only routes (get_read_db), unset to read from primary
+    POSTGRES_REPLICA_HOSTNAME: Optional[str] = None
+    # After a user writes, their reads go to the primary for this long
+    REPLICA_STICKINESS_SECONDS: float = 5.0
+    # After the replica fails, reads go to the primary for this long
+    REPLICA_RETRY_AFTER: float = 30.0
+    # Seconds (libpq accepts whole seconds), so a replica that doesn't answer
+    # falls back to the primary quickly instead of waiting for the TCP timeout
+    DB_REPLICA_CONNECT_TIMEOUT: int = 2
+
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 15.0
+    HTTP_WRITE_TIMEOUT: float = 15.0
+    HTTP_POOL_TIMEOUT: float = 5.0
+    HTTP2_ENABLED: bool = False
+
+    UPSTREAM_TIMEOUT: float = 20.0
+    # Overrides keyed by "<upstream>.<operation>", e.g. {"baserow.get_page": 5}
+    UPSTREAM_OPERATION_TIMEOUTS: Dict[str, float] = {}
+    UPSTREAM_RETRIES: int = 2
+    UPSTREAM_RETRY_BASE_DELAY: float = 0.2
+    UPSTREAM_RETRY_MAX_DELAY: float = 2.0
+    UPSTREAM_BREAKER_FAILURE_THRESHOLD: int = 5
+    UPSTREAM_BREAKER_RESET_TIMEOUT: float = 30.0
+    UPSTREAM_MAX_CONCURRENCY: int = 20
+    UPSTREAM_BULKHEAD_WAIT: float = 1.0
+
+    HASH_POOL_WORKERS: Optional[int] = None
+    HASH_MAX_PENDING: int = 64
+
+    # "memory" (per worker), "postgres" (shared by all workers) or "off"
+    LOGIN_RATE_LIMIT_BACKEND: str = "memory"
+    LOGIN_RATE_LIMIT_MAX_KEYS: int = 100000
+    LOGIN_IP_BURST: int = 20
+    LOGIN_IP_PER_MINUTE: float = 30.0
+    # Keyed by email and client network (of these prefix lengths), see
+    # LoginRateLimiter for the lockout trade-off
+    LOGIN_EMAIL_BURST: int = 5
+    LOGIN_EMAIL_PER_MINUTE: float = 2.0
+    LOGIN_EMAIL_IPV4_PREFIX: int = 24
+    LOGIN_EMAIL_IPV6_PREFIX: int = 64
+
+    BASEROW_CACHE_TTL: float = 30.0
+    BASEROW_CACHE_TABLE_TTLS: Dict[str, float] = {}
+    BASEROW_CACHE_STALE_TTL: float = 300.0
+    BASEROW_CACHE_STALE_IF_ERROR: float = 3600.0
+    BASEROW_PAGE_SIZE: int = 100
+    BASEROW_PAGE_CONCURRENCY: int = 4
+
+    WS_QUEUE_SIZE: int = 100
+    WS_LISTEN_RECONNECT_DELAY: float = 5.0
+
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PRINCIPAL_CACHE_TTL: float = 60.0
+
+    OUTBOX_POLL_INTERVAL: float = 2.0
+    OUTBOX_BATCH_SIZE: int = 10
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_BASE_DELAY: float = 2.0
+    OUTBOX_MAX_DELAY: float = 300.0
+    OUTBOX_LEASE: float = 300.0
+
+    READINESS_TIMEOUT: float = 2.0
+
+    SQL_SLOW_QUERY_MS: float = 200.0
+    # "off", "warn" or "raise" when a request repeats one statement too often
+    SQL_REPEATED_QUERY_MODE: str = "off"
+    SQL_REPEATED_QUERY_THRESHOLD: int = 10
+
     class Config:
         env_file = ".env"
 
@@ -1,26 +1,166 @@
 # baserow_connector.py
 
+import asyncio
+from typing import AsyncIterator, Awaitable, Dict, List, Optional
+
 import httpx
 from app.config import settings
+from app.connectors.cache import TTLCache
+from app.connectors.http_clients import BASEROW, get_client, make_timeout
+from app.connectors.resilience import UPSTREAMS
+
+baserow = UPSTREAMS[BASEROW]
 
 BASEROW_CONNECTOR_URL = f"{settings.BASEROW_CONNECTOR_URL}/api"
 
+baserow_cache = TTLCache(
+    default_ttl=settings.BASEROW_CACHE_TTL,
+    ttls=settings.BASEROW_CACHE_TABLE_TTLS,
+    stale_ttl=settings.BASEROW_CACHE_STALE_TTL,
+    stale_if_error=settings.BASEROW_CACHE_STALE_IF_ERROR,
+)
 
-async def BW_add_student_to_baserow(user_data: dict):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(f"{BASEROW_CONNECTOR_URL}/student", json=user_data)
+
+async def BW_add_student_to_baserow(
+    user_data: dict, timeout: Optional[httpx.Timeout] = None
+):
+    async def request():
+        response = await get_client(BASEROW).post(
+            f"{BASEROW_CONNECTOR_URL}/student",
+            json=user_data,
+            timeout=timeout or make_timeout(),
+        )
         response.raise_for_status()
         return response.json()
 
+    # Not idempotent, a retry could add the student twice
+    return await baserow.call("add_student", request)
+
 
-async def BW_get_data(table_name: str):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{BASEROW_CONNECTOR_URL}/{table_name}")
+async def BW_get_page(
+    table_name: str, page: int, size: int, timeout: Optional[httpx.Timeout] = None
+):
+    async def request():
+        response = await get_client(BASEROW).get(
+            f"{BASEROW_CONNECTOR_URL}/{table_name}",
+            params={"page": page, "size": size},
+            timeout=timeout or make_timeout(),
+        )
+        response.raise_for_status()
         return response.json()
 
+    return await baserow.call("get_page", request, idempotent=True)
+
+
+async def BW_find_student_by_email(
+    email: str, timeout: Optional[httpx.Timeout] = None
+) -> Optional[dict]:
+    """
+    One filtered, uncached lookup, so a row added moments ago by an earlier
+    attempt of the same job is found.
+    """
+
+    async def request():
+        response = await get_client(BASEROW).get(
+            f"{BASEROW_CONNECTOR_URL}/Student",
+            params={"filter__email__equal": email},
+            timeout=timeout or make_timeout(),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    data = (await baserow.call("find_student", request, idempotent=True))["data"]
+    # Matched here too, the filter only narrows the rows sent back
+    for row in data["results"]:
+        if row.get("email") == email:
+            return row
+    return None
+
+
+class PageSnapshot:
+    """
+    Page 1 of a table and every later page fetched after it. The whole set is
+    cached (and expires or is invalidated) as one entry, so a stream never
+    combines pages of different fetches with a stale page 1 `count`. Later
+    pages are fetched at most once per snapshot.
+    """
 
-async def BW_delete_student_by_email(value: str):
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(f"{BASEROW_CONNECTOR_URL}/student/email/{value}")
-        # print(response)
+    def __init__(self, table_name: str, size: int, first_page: dict):
+        self.table_name = table_name
+        self.size = size
+        self.first_page = first_page
+        self._pages: Dict[int, asyncio.Task] = {}
+
+    def page(self, page: int) -> Awaitable[dict]:
+        task = self._pages.get(page)
+        if task is None or (task.done() and (task.cancelled() or task.exception())):
+            task = asyncio.ensure_future(BW_get_page(self.table_name, page, self.size))
+            # Errors are raised to the waiters, don't also log them as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._pages[page] = task
+        # A cancelled stream must not cancel a fetch other streams share
+        return asyncio.shield(task)
+
+
+async def BW_get_snapshot(table_name: str, size: int) -> PageSnapshot:
+    # The returned data is shared between requests, callers must not mutate it
+    async def load():
+        first_page = await BW_get_page(table_name, 1, size)
+        return PageSnapshot(table_name, size, first_page)
+
+    return await baserow_cache.get(table_name, ("pages", size), load)
+
+
+async def BW_iter_pages(
+    table_name: str,
+    size: int = settings.BASEROW_PAGE_SIZE,
+    concurrency: int = settings.BASEROW_PAGE_CONCURRENCY,
+) -> AsyncIterator[List[dict]]:
+    """
+    Yields the rows of every page of a table in page order, all from one
+    PageSnapshot. After the first page, up to `concurrency` pages are fetched
+    ahead; pages that arrive early wait for their turn within that window.
+    """
+    snapshot = await BW_get_snapshot(table_name, size)
+    first_page = snapshot.first_page
+    yield first_page["data"]["results"]
+
+    count = first_page["data"].get("count")
+    if count is None:
+        # No total available, follow the `next` links one page at a time
+        page, response = 1, first_page
+        while response["data"].get("next"):
+            page += 1
+            response = await snapshot.page(page)
+            yield response["data"]["results"]
+        return
+
+    last_page = -(-count // size)
+    next_page = 2
+    # page -> fetch, fetched or not; the next page to yield is always the lowest
+    pending: Dict[int, asyncio.Future] = {}
+    try:
+        for page in range(2, last_page + 1):
+            while next_page <= last_page and len(pending) < concurrency:
+                pending[next_page] = asyncio.ensure_future(snapshot.page(next_page))
+                next_page += 1
+
+            response = await pending.pop(page)
+            yield response["data"]["results"]
+    finally:
+        for task in pending.values():
+            task.cancel()
+
+
+async def BW_delete_student_by_email(
+    value: str, timeout: Optional[httpx.Timeout] = None
+):
+    async def request():
+        response = await get_client(BASEROW).delete(
+            f"{BASEROW_CONNECTOR_URL}/student/email/{value}",
+            timeout=timeout or make_timeout(),
+        )
+        response.raise_for_status()
         return response.json()
+
+    return await baserow.call("delete_student", request, idempotent=True)
@@ -1,14 +1,26 @@
 # baserow_connector.py
 
+from typing import Optional
+
 import httpx
 from app.config import settings
+from app.connectors.http_clients import BPMN_ENGINE, get_client, make_timeout
+from app.connectors.resilience import UPSTREAMS
+
+bpmn_engine = UPSTREAMS[BPMN_ENGINE]
 
 BPMN_ENGINE_CONNECTOR_URL = f"{settings.BPMN_ENGINE_URL}"
 
 
-async def BE_remove_instance_by_id(instance_id: str):
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(
-            f"{BPMN_ENGINE_CONNECTOR_URL}/instance/{instance_id}"
+async def BE_remove_instance_by_id(
+    instance_id: str, timeout: Optional[httpx.Timeout] = None
+):
+    async def request():
+        response = await get_client(BPMN_ENGINE).delete(
+            f"{BPMN_ENGINE_CONNECTOR_URL}/instance/{instance_id}",
+            timeout=timeout or make_timeout(),
         )
+        response.raise_for_status()
         return response.json()
+
+    return await bpmn_engine.call("remove_instance", request, idempotent=True)
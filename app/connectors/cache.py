@@ -0,0 +1,128 @@
+# cache.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "generation")
+
+    def __init__(self, value: Any, fetched_at: float, generation: int):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.generation = generation
+
+
+class TTLCache:
+    """
+    In-process cache for upstream reads, keyed by (namespace, key).
+
+    - entries younger than the namespace TTL are served as-is
+    - entries up to `stale_ttl` past their TTL are served immediately while a
+      single background refresh runs
+    - older entries block on a refresh; if that refresh fails, entries up to
+      `stale_if_error` old are served instead of the error
+    - concurrent loads of the same key share one upstream call
+
+    Invalidated entries are kept, but only as a fallback for a failed reload.
+    Each worker process holds its own cache, so invalidation is per process.
+    """
+
+    def __init__(
+        self,
+        default_ttl: float,
+        ttls: Optional[Dict[str, float]] = None,
+        stale_ttl: float = 0.0,
+        stale_if_error: float = 0.0,
+    ):
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.stale_ttl = stale_ttl
+        self.stale_if_error = stale_if_error
+
+        self._entries: Dict[Tuple[str, Hashable], _Entry] = {}
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._generations: Dict[str, int] = {}
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "stale_on_error": 0,
+        }
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    async def get(self, namespace: str, key: Hashable, loader: Loader) -> Any:
+        cache_key = (namespace, key)
+        entry = self._entries.get(cache_key)
+        now = time.monotonic()
+
+        generation = self._generations.get(namespace, 0)
+        if entry is not None and entry.generation == generation:
+            age = now - entry.fetched_at
+            ttl = self.ttl_for(namespace)
+            if age < ttl:
+                self._stats["hits"] += 1
+                return entry.value
+            if age < ttl + self.stale_ttl:
+                self._stats["stale_hits"] += 1
+                self._load(cache_key, loader)
+                return entry.value
+
+        self._stats["misses"] += 1
+        try:
+            return await asyncio.shield(self._load(cache_key, loader))
+        except Exception as e:
+            if entry is not None and now - entry.fetched_at < self.stale_if_error:
+                self._stats["stale_on_error"] += 1
+                logger.warning(f"Serving stale {namespace} data after error: {e}")
+                return entry.value
+            raise
+
+    def _load(self, cache_key: Tuple[str, Hashable], loader: Loader) -> asyncio.Task:
+        task = self._inflight.get(cache_key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+            return task
+
+        task = asyncio.ensure_future(self._refresh(cache_key, loader))
+        self._inflight[cache_key] = task
+        task.add_done_callback(lambda t: self._on_done(cache_key, t))
+        return task
+
+    async def _refresh(self, cache_key: Tuple[str, Hashable], loader: Loader) -> Any:
+        namespace = cache_key[0]
+        generation = self._generations.get(namespace, 0)
+        self._stats["refreshes"] += 1
+        value = await loader()
+        # Drop results of loads that started before an invalidation
+        if self._generations.get(namespace, 0) == generation:
+            self._entries[cache_key] = _Entry(value, time.monotonic(), generation)
+        return value
+
+    def _on_done(self, cache_key: Tuple[str, Hashable], task: asyncio.Task):
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+        if not task.cancelled() and task.exception() is not None:
+            self._stats["refresh_errors"] += 1
+            logger.error(f"Error refreshing {cache_key[0]} cache: {task.exception()}")
+
+    def invalidate(self, namespace: str):
+        # Entries of older generations are reloaded before being served again
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        for cache_key in [k for k in self._inflight if k[0] == namespace]:
+            # Let the running load finish for its waiters, but don't coalesce onto it
+            del self._inflight[cache_key]
+
+    def stats(self) -> dict:
+        return {**self._stats, "entries": len(self._entries)}
@@ -0,0 +1,65 @@
+# http_clients.py
+
+from typing import Dict, Optional
+
+import httpx
+from app.config import settings
+
+BASEROW = "baserow"
+BPMN_ENGINE = "bpmn_engine"
+
+# Long-lived clients, one per upstream, so calls reuse pooled keep-alive connections
+_clients: Dict[str, httpx.AsyncClient] = {}
+# Clients injected from outside (tests) are not closed by us
+_injected: Dict[str, httpx.AsyncClient] = {}
+
+
+def make_timeout(
+    connect: Optional[float] = None, read: Optional[float] = None
+) -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=connect if connect is not None else settings.HTTP_CONNECT_TIMEOUT,
+        read=read if read is not None else settings.HTTP_READ_TIMEOUT,
+        write=settings.HTTP_WRITE_TIMEOUT,
+        pool=settings.HTTP_POOL_TIMEOUT,
+    )
+
+
+def build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        limits=limits, timeout=make_timeout(), http2=settings.HTTP2_ENABLED
+    )
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    if name in _injected:
+        return _injected[name]
+
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        # Created on first use, in and outside of the app lifespan
+        client = build_client()
+        _clients[name] = client
+    return client
+
+
+def set_client(name: str, client: Optional[httpx.AsyncClient]):
+    """
+    Inject a client for the given upstream (e.g. one backed by httpx.MockTransport
+    or httpx.ASGITransport in tests). Passing None removes the injected client.
+    """
+    if client is None:
+        _injected.pop(name, None)
+    else:
+        _injected[name] = client
+
+
+async def shutdown():
+    for name, client in list(_clients.items()):
+        await client.aclose()
+        del _clients[name]
@@ -0,0 +1,241 @@
+# resilience.py
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from app.config import settings
+from app.connectors.http_clients import BASEROW, BPMN_ENGINE
+from app.metrics import UPSTREAM_REJECTIONS, UPSTREAM_REQUEST_DURATION
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class UpstreamUnavailable(Exception):
+    """The call was rejected locally, without reaching the upstream."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class BulkheadFullError(UpstreamUnavailable):
+    pass
+
+
+def is_transient(exc: BaseException) -> bool:
+    # Network errors, timeouts, 5xx and 429 count against the upstream's health;
+    # other 4xx responses are the caller's problem
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code >= 500 or code == 429
+    return False
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through, consecutive transient failures are counted.
+    open: calls fail fast until `reset_timeout` has passed.
+    half_open: a single probe call is let through; success closes the breaker,
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def before_call(self, name: str):
+        state = self.state
+        if state == self.OPEN:
+            raise CircuitOpenError(f"{name} circuit is open")
+        if state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(f"{name} circuit is half-open")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def abandon_probe(self):
+        # The probe was cancelled without an outcome, let the next call probe
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        state = self.state
+        snapshot = {"state": state, "consecutive_failures": self._failures}
+        if state == self.OPEN:
+            snapshot["retry_in"] = round(
+                self.reset_timeout - (time.monotonic() - self._opened_at), 1
+            )
+        return snapshot
+
+
+class Upstream:
+    """
+    Wraps every call to one upstream service with a circuit breaker, a bulkhead
+    (at most `max_concurrency` calls in flight, waiting at most `bulkhead_wait`
+    for a slot), an overall per-operation timeout, and retries with full jitter
+    for idempotent operations.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = settings.UPSTREAM_TIMEOUT,
+        operation_timeouts: Optional[Dict[str, float]] = None,
+        retries: int = settings.UPSTREAM_RETRIES,
+        retry_base_delay: float = settings.UPSTREAM_RETRY_BASE_DELAY,
+        retry_max_delay: float = settings.UPSTREAM_RETRY_MAX_DELAY,
+        failure_threshold: int = settings.UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = settings.UPSTREAM_BREAKER_RESET_TIMEOUT,
+        max_concurrency: int = settings.UPSTREAM_MAX_CONCURRENCY,
+        bulkhead_wait: float = settings.UPSTREAM_BULKHEAD_WAIT,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.operation_timeouts = dict(operation_timeouts or {})
+        self.retries = retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_concurrency = max_concurrency
+        self.bulkhead_wait = bulkhead_wait
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created on first use, so it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def timeout_for(self, operation: str) -> float:
+        return self.operation_timeouts.get(operation, self.timeout)
+
+    def _retry_delay(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+        )
+
+    async def call(
+        self,
+        operation: str,
+        fn: Callable[[], Awaitable[T]],
+        idempotent: bool = False,
+        timeout: Optional[float] = None,
+    ) -> T:
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.bulkhead_wait)
+        except asyncio.TimeoutError:
+            UPSTREAM_REJECTIONS.labels(self.name, "bulkhead").inc()
+            raise BulkheadFullError(
+                f"{self.name} has {self.max_concurrency} calls in flight"
+            )
+
+        self._in_flight += 1
+        try:
+            attempts = 1 + (self.retries if idempotent else 0)
+            for attempt in range(attempts):
+                try:
+                    self.breaker.before_call(self.name)
+                except CircuitOpenError:
+                    UPSTREAM_REJECTIONS.labels(self.name, "circuit_open").inc()
+                    raise
+
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(
+                        fn(), timeout or self.timeout_for(operation)
+                    )
+                except asyncio.CancelledError:
+                    self.breaker.abandon_probe()
+                    raise
+                except Exception as e:
+                    transient = is_transient(e)
+                    UPSTREAM_REQUEST_DURATION.labels(
+                        self.name, operation, "error" if transient else "client_error"
+                    ).observe(time.perf_counter() - start)
+                    if not transient:
+                        self.breaker.record_success()
+                        raise
+                    self.breaker.record_failure()
+                    if attempt + 1 >= attempts:
+                        raise
+                    delay = self._retry_delay(attempt)
+                    logger.warning(
+                        f"{self.name} {operation} failed ({e!r}), "
+                        f"retrying in {delay:.2f}s"
+                    )
+                    await asyncio.sleep(delay)
+                else:
+                    UPSTREAM_REQUEST_DURATION.labels(
+                        self.name, operation, "success"
+                    ).observe(time.perf_counter() - start)
+                    self.breaker.record_success()
+                    return result
+        finally:
+            self._in_flight -= 1
+            semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.breaker.snapshot(),
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+def operation_timeouts(name: str) -> Dict[str, float]:
+    prefix = f"{name}."
+    return {
+        key[len(prefix) :]: value
+        for key, value in settings.UPSTREAM_OPERATION_TIMEOUTS.items()
+        if key.startswith(prefix)
+    }
+
+
+UPSTREAMS: Dict[str, Upstream] = {
+    BASEROW: Upstream(BASEROW, operation_timeouts=operation_timeouts(BASEROW)),
+    BPMN_ENGINE: Upstream(
+        BPMN_ENGINE, operation_timeouts=operation_timeouts(BPMN_ENGINE)
+    ),
+}
+
+
+def upstream_states() -> dict:
+    return {name: upstream.snapshot() for name, upstream in UPSTREAMS.items()}
@@ -1,8 +1,28 @@
-from sqlalchemy import create_engine
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from uuid import uuid4
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from app.config import settings
+from app import metrics
+from app import query_stats
+
+logger = logging.getLogger(__name__)
 
 DB = {
     "provider": "postgres",
@@ -16,9 +36,225 @@ SQLALCHEMY_DATABASE_URL = (
     f"postgresql://{DB['user']}:{DB['password']}@{DB['host']}/{DB['database']}"
 )
 
+ASYNC_SQLALCHEMY_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB['user']}:{DB['password']}@{DB['host']}/{DB['database']}"
+)
+
+# Bypasses PgBouncer: LISTEN and the migrations' session-level work can't run
+# through transaction pooling
+DIRECT_SQLALCHEMY_DATABASE_URL = (
+    f"postgresql://{DB['user']}:{DB['password']}"
+    f"@{settings.POSTGRES_DIRECT_HOSTNAME or DB['host']}/{DB['database']}"
+)
+
+REPLICA_SQLALCHEMY_DATABASE_URL = (
+    f"postgresql://{DB['user']}:{DB['password']}"
+    f"@{settings.POSTGRES_REPLICA_HOSTNAME}/{DB['database']}"
+    if settings.POSTGRES_REPLICA_HOSTNAME
+    else None
+)
+
+
+def engine_options() -> dict:
+    if settings.DB_PGBOUNCER:
+        # PgBouncer already pools server connections, holding idle ones here
+        # too would only pin them
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+
+def async_connect_args() -> dict:
+    if settings.DB_PGBOUNCER:
+        # Consecutive transactions may run on different server connections, so
+        # statements prepared on one don't exist on the next. SQLAlchemy still
+        # prepares named statements, and asyncpg's default names collide between
+        # client connections sharing a server connection, hence unique names
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return {}
+
+
+# Engines are created on first use rather than at import, so importing the app
+# (workers, tests, scripts) doesn't build connection pools it may never use
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+_replica_engine: Optional[Engine] = None
+# Sync routes run in the threadpool, so the first requests can race to create it
+_engine_lock = threading.Lock()
+
+_sessionmaker = sessionmaker(autocommit=False, autoflush=False)
+_async_sessionmaker = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+def instrument(engine: Engine, name: str):
+    # Per-request query counts/time, slow-query log and the repeated-query check
+    query_stats.instrument_engine(engine)
+    metrics.instrument_engine(engine, name)
+
+
+# Sync engine, used by plain `def` routes (run in the threadpool)
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options())
+                instrument(engine, "sync")
+                _engine = engine
+    return _engine
+
+
+# Replica engine, used by read-only sync routes through get_read_db
+def get_replica_engine() -> Engine:
+    global _replica_engine
+    if _replica_engine is None:
+        with _engine_lock:
+            if _replica_engine is None:
+                engine = create_engine(
+                    REPLICA_SQLALCHEMY_DATABASE_URL,
+                    connect_args={
+                        "connect_timeout": settings.DB_REPLICA_CONNECT_TIMEOUT
+                    },
+                    **engine_options(),
+                )
+                instrument(engine, "replica")
+                _replica_engine = engine
+    return _replica_engine
+
+
+# Async engine, used by `async def` routes so they never block the event loop
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            ASYNC_SQLALCHEMY_DATABASE_URL,
+            connect_args=async_connect_args(),
+            **engine_options(),
+        )
+        instrument(_async_engine.sync_engine, "async")
+    return _async_engine
+
+
+# Kept as SessionLocal()/AsyncSessionLocal() so callers don't change
+def SessionLocal() -> Session:
+    return _sessionmaker(bind=get_engine())
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    return _async_sessionmaker(bind=get_async_engine())
+
+
+async def dispose_engines():
+    global _engine, _async_engine, _replica_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+    if _replica_engine is not None:
+        _replica_engine.dispose()
+        _replica_engine = None
+
+
+class ReadRouter:
+    """
+    Decides whether a read-only session may use the replica.
+
+    Read-your-writes: when a session that wrote something commits, the user
+    (keyed by a hash of their Authorization header) is stuck to the primary
+    for `stickiness` seconds, long enough for the replica to catch up. When
+    the replica can't be reached, everybody reads from the primary for
+    `retry_after` seconds.
+
+    State is per worker process. A user's next read can land on another
+    worker; size `stickiness` generously if that matters.
+    """
+
+    def __init__(self, stickiness: float, retry_after: float, max_keys: int = 10000):
+        self.stickiness = stickiness
+        self.retry_after = retry_after
+        self.max_keys = max_keys
+        # key -> monotonic time until which it reads from the primary, in LRU order
+        self._sticky_until: OrderedDict = OrderedDict()
+        self._replica_down_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(request: Request) -> Optional[str]:
+        authorization = request.headers.get("authorization")
+        if not authorization:
+            return None
+        return hashlib.sha256(authorization.encode()).hexdigest()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def mark_written(self, key: str):
+        with self._lock:
+            self._sticky_until[key] = time.monotonic() + self.stickiness
+            self._sticky_until.move_to_end(key)
+            while len(self._sticky_until) > self.max_keys:
+                self._sticky_until.popitem(last=False)
+
+    def is_sticky(self, key: Optional[str]) -> bool:
+        if key is None:
+            return False
+        with self._lock:
+            until = self._sticky_until.get(key)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._sticky_until[key]
+                return False
+            return True
+
+    def replica_available(self) -> bool:
+        return time.monotonic() >= self._replica_down_until
+
+    def mark_replica_down(self):
+        self._replica_down_until = time.monotonic() + self.retry_after
+
+
+read_router = ReadRouter(
+    stickiness=settings.REPLICA_STICKINESS_SECONDS,
+    retry_after=settings.REPLICA_RETRY_AFTER,
+)
+
+
+# Both the sync sessions and the async sessions' sync_session emit these
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_writes(orm_execute_state):
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _stick_after_write(session):
+    if session.info.pop("wrote", False):
+        key = session.info.get("sticky_key")
+        if key is not None:
+            read_router.mark_written(key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_writes(session):
+    session.info.pop("wrote", None)
 
 
 Base = declarative_base()
@@ -27,11 +263,65 @@ Base = declarative_base()
 from sqlalchemy.exc import SQLAlchemyError
 
 
-def get_db():
+def get_db(request: Request):
     db = SessionLocal()
+    db.info["sticky_key"] = read_router.key(request)
     try:
         yield db
     except SQLAlchemyError as e:
         print(f"Database error: {str(e)}")
     finally:
         db.close()
+
+
+async def get_async_db(request: Request):
+    db: AsyncSession = AsyncSessionLocal()
+    db.info["sticky_key"] = read_router.key(request)
+    try:
+        yield db
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {e}")
+    finally:
+        await db.close()
+
+
+def open_read_session(key: Optional[str]) -> Session:
+    if REPLICA_SQLALCHEMY_DATABASE_URL is None:
+        metrics.DB_READ_ROUTING.labels("primary").inc()
+        return SessionLocal()
+    if read_router.is_sticky(key):
+        metrics.DB_READ_ROUTING.labels("primary_sticky").inc()
+        return SessionLocal()
+    if not read_router.replica_available():
+        metrics.DB_READ_ROUTING.labels("primary_fallback").inc()
+        return SessionLocal()
+
+    db = _sessionmaker(bind=get_replica_engine())
+    try:
+        # Check out a connection now, so an unreachable replica is noticed
+        # before the route runs its queries
+        db.connection()
+    except SQLAlchemyError as e:
+        db.close()
+        read_router.mark_replica_down()
+        logger.warning(f"Replica unavailable, reading from primary: {e}")
+        metrics.DB_READ_ROUTING.labels("primary_fallback").inc()
+        return SessionLocal()
+    metrics.DB_READ_ROUTING.labels("replica").inc()
+    return db
+
+
+def get_read_db(request: Request):
+    """
+    Session for read-only routes: the replica when one is configured, unless
+    the user wrote recently or the replica is down.
+    """
+    key = read_router.key(request)
+    db = open_read_session(key)
+    db.info["sticky_key"] = key
+    try:
+        yield db
+    except SQLAlchemyError as e:
+        logger.error(f"Database error: {e}")
+    finally:
+        db.close()
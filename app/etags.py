@@ -0,0 +1,61 @@
+import hashlib
+from typing import Iterable, List
+
+from fastapi import Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+def table_versions(db: Session, tables: Iterable[str]) -> List[int]:
+    tables = list(tables)
+    rows = db.execute(
+        select(models.TableVersion.table_name, models.TableVersion.version).where(
+            models.TableVersion.table_name.in_(tables)
+        )
+    ).all()
+    versions = dict(rows)
+    return [versions.get(table, 0) for table in tables]
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def list_etag(db: Session, tables: Iterable[str], *scope) -> str:
+    """
+    Weak ETag of a list built from `tables`, for the given scope (route, user).
+
+    Must be computed before the list is queried: if a write commits in between,
+    the tag is older than the body and the next poll simply gets the list again,
+    whereas the other way round a client could keep a stale list.
+    """
+    tables = list(tables)
+    return make_etag(*scope, *tables, *table_versions(db, tables))
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in header.split(",")
+    )
+
+
+def tag(response: Response, etag: str) -> Response:
+    response.headers["ETag"] = etag
+    # Per user data, always revalidate (cheap with If-None-Match)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    return tag(Response(status_code=status.HTTP_304_NOT_MODIFIED), etag)
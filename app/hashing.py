@@ -0,0 +1,113 @@
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+
+from app import utils
+from app.config import settings
+from app.metrics import PASSWORD_HASH_DURATION
+
+
+class HashingService:
+    """
+    Runs bcrypt hashing/verification in a process pool so it never blocks the
+    event loop or a threadpool slot. At most `max_pending` calls may be queued
+    or running at once; anything beyond that is rejected with a 503.
+    """
+
+    # Used by imitate_verify until a real verify has been timed
+    DEFAULT_VERIFY_SECONDS = 0.25
+    VERIFY_EWMA_WEIGHT = 0.1
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 64):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Moving average of how long a verify takes, as seen by the caller
+        self._verify_seconds: Optional[float] = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # "spawn" keeps the workers free of the parent's event loop and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        if self._pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again.",
+                headers={"Retry-After": "1"},
+            )
+
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+            PASSWORD_HASH_DURATION.labels(operation).observe(
+                time.perf_counter() - start
+            )
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", utils.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        start = time.perf_counter()
+        result = await self._run(
+            "verify", utils.verify, plain_password, hashed_password
+        )
+        elapsed = time.perf_counter() - start
+        if self._verify_seconds is None:
+            self._verify_seconds = elapsed
+        else:
+            self._verify_seconds += self.VERIFY_EWMA_WEIGHT * (
+                elapsed - self._verify_seconds
+            )
+        return result
+
+    async def imitate_verify(self):
+        """
+        Takes about as long as verify() without using any CPU, so a login for
+        an unknown email can't be told apart by its response time.
+        """
+        seconds = self._verify_seconds or self.DEFAULT_VERIFY_SECONDS
+        await asyncio.sleep(seconds * random.uniform(0.9, 1.1))
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        # One chunk per worker process, so a bulk job takes only a few queue slots
+        workers = self.max_workers or os.cpu_count() or 1
+        chunk_size = max(1, -(-len(passwords) // workers))
+        chunks = [
+            passwords[i : i + chunk_size]
+            for i in range(0, len(passwords), chunk_size)
+        ]
+        hashed = await asyncio.gather(
+            *(self._run("hash_many", utils.hash_many, chunk) for chunk in chunks)
+        )
+        return [password for chunk in hashed for password in chunk]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+hasher = HashingService(
+    max_workers=settings.HASH_POOL_WORKERS, max_pending=settings.HASH_MAX_PENDING
+)
@@ -1,26 +1,82 @@
-from fastapi import FastAPI
+import time
+
+# Measured from here, so the reported startup time includes importing the app
+IMPORT_STARTED_AT = time.perf_counter()
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, status
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.routers import auth, user, student, admin
+from app.routers import auth, user, student, admin, realtime
 
-from app.db import engine, get_db
-from app import models
-import app.db
-from sqlalchemy.orm import Session
+from app.db import dispose_engines, get_async_engine
+from sqlalchemy import text
 
 from app.config import settings
+from app.connectors import http_clients
+from app.connectors.resilience import upstream_states
+from app.metrics import APP_STARTUP_SECONDS, MetricsMiddleware, metrics_response
+from app.query_stats import QueryStatsMiddleware
+from app.hashing import hasher
+from app.realtime import listener
+from app.outbox import outbox_worker
 
 import bugsnag
 from bugsnag.asgi import BugsnagMiddleware
 
-
-app = FastAPI()
-import os, sys
-import time
+import os
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here waits on the network: engines, HTTP clients and the hashing
+    # pool are created on first use, and the realtime listener and outbox
+    # worker connect in the background. A database outage doesn't stop the
+    # service from booting, it shows up in /ready instead.
+    started_at = time.perf_counter()
+    bugsnag.configure(
+        api_key=settings.BUGSNAG,
+        project_root=project_root,
+    )
+    listener.start()
+    outbox_worker.start()
+
+    startup_seconds = time.perf_counter() - started_at
+    APP_STARTUP_SECONDS.labels("import").set(IMPORT_SECONDS)
+    APP_STARTUP_SECONDS.labels("lifespan").set(startup_seconds)
+    app.state.startup_ms = {
+        "import": round(IMPORT_SECONDS * 1000, 1),
+        "lifespan": round(startup_seconds * 1000, 1),
+    }
+    app.state.ready = True
+    logger.info(
+        f"Started in {(IMPORT_SECONDS + startup_seconds) * 1000:.1f} ms "
+        f"(import {IMPORT_SECONDS * 1000:.1f} ms)"
+    )
+    yield
+    # Stop advertising readiness first, so no new traffic is sent our way
+    app.state.ready = False
+    await outbox_worker.stop()
+    await listener.stop()
+    await http_clients.shutdown()
+    await dispose_engines()
+    hasher.shutdown()
+
+
+# orjson for every route that returns plain data
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.state.ready = False
 
-models.Base.metadata.create_all(bind=engine)
+# The schema is managed with Alembic migrations (`alembic upgrade head`)
 
 
 origins = ["https://fp-fipu-internship-frontend.onrender.com", "http://localhost:5173"]
@@ -48,19 +104,70 @@ async def status_check():
     }
 
 
-project_root = os.path.dirname(os.path.abspath(__file__))
+async def check_database():
+    async with get_async_engine().connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe, separate from the /status liveness check. Returns 503
+    until the lifespan startup has finished, during shutdown, and while
+    Postgres can't be reached. Upstream services are reported but don't affect
+    readiness, /status/upstreams has their details.
+    """
+    checks = {"startup": "ok" if app.state.ready else "pending"}
+    try:
+        await asyncio.wait_for(check_database(), settings.READINESS_TIMEOUT)
+        checks["database"] = "ok"
+    except Exception as e:
+        logger.warning(f"Readiness check: database unavailable - {e!r}")
+        checks["database"] = "unavailable"
+
+    ready = all(check == "ok" for check in checks.values())
+    upstreams = upstream_states()
+    return ORJSONResponse(
+        {
+            "ready": ready,
+            "checks": checks,
+            "upstreams": {name: state["state"] for name, state in upstreams.items()},
+            "startup_ms": getattr(app.state, "startup_ms", None),
+        },
+        status_code=(
+            status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Prometheus metrics, aggregated over all workers in multiprocess mode.
+    """
+    return metrics_response()
+
+
+@app.get("/status/upstreams")
+async def upstreams_status_check():
+    """
+    Circuit breaker state and in-flight calls for each upstream service.
+    """
+    return upstream_states()
 
-bugsnag.configure(
-    api_key=settings.BUGSNAG,
-    project_root=project_root,
-)
 
 app.add_middleware(BugsnagMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+# Added last so it is the outermost middleware and times the whole request
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(user.router)
 app.include_router(student.router)
 app.include_router(admin.router)
+app.include_router(realtime.router)
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED_AT
 
 
 # conda activate fipu-internship-gateway-api
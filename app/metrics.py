@@ -0,0 +1,158 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import Response
+
+# With several workers (gunicorn/uvicorn --workers) every process writes its
+# samples to PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them, so it
+# doesn't matter which worker serves the scrape
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route template and status.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status.",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the SQLAlchemy pool.",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Connections open beyond the SQLAlchemy pool size.",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+DB_READ_ROUTING = Counter(
+    "db_read_routing_total",
+    "Sessions opened by get_read_db, by where they were routed and why.",
+    ["target"],
+)
+
+APP_STARTUP_SECONDS = Gauge(
+    "app_startup_seconds",
+    "Time spent importing the app and running the lifespan startup.",
+    ["phase"],
+    multiprocess_mode="max",
+)
+
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of each call attempt to an upstream service.",
+    ["upstream", "operation", "outcome"],
+)
+UPSTREAM_REJECTIONS = Counter(
+    "upstream_rejections_total",
+    "Upstream calls rejected locally by the circuit breaker or bulkhead.",
+    ["upstream", "reason"],
+)
+
+LOGIN_RATE_LIMITED = Counter(
+    "login_rate_limited_total",
+    "Login attempts rejected by the rate limiter, by the bucket that was empty.",
+    ["bucket"],
+)
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt hashing/verification time, including the wait for a pool worker.",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware, so the response body isn't
+    re-buffered) that records request count, latency and in-flight requests.
+
+    Requests are labelled with the route template (`/users/messages/{receiver_id}`),
+    never the raw path, to keep the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+            # The router stores the matched route in the (shared) scope
+            route = scope.get("route")
+            route = getattr(route, "path", UNMATCHED_ROUTE)
+            status = str(status_code)
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            HTTP_REQUEST_DURATION.labels(method, route, status).observe(duration)
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Keeps the pool gauges up to date from the pool's own checkout/checkin events."""
+    pool = engine.pool
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    overflow = DB_POOL_OVERFLOW.labels(name)
+
+    def update(*args):
+        # Pools without a fixed size (NullPool, StaticPool) have no such counters
+        if hasattr(pool, "checkedout"):
+            checked_out.set(pool.checkedout())
+        if hasattr(pool, "overflow"):
+            overflow.set(max(0, pool.overflow()))
+
+    event.listen(engine, "checkout", update)
+    event.listen(engine, "checkin", update)
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
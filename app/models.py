@@ -1,5 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, Boolean 
+from typing import Optional
+
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Boolean, Index, Float, BigInteger
 from sqlalchemy.sql.sqltypes import TIMESTAMP
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -48,7 +51,8 @@ class Admin(User):
 class Student(User):
     __tablename__ = "student"
     id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)
-    baserow_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Filled in by the outbox worker once the student is added to Baserow
+    baserow_id: Mapped[Optional[int]] = mapped_column(Integer)
     JMBAG = Column(String, nullable=False, unique=True)
     godina_studija = Column(String, nullable=True)
     process_instance_id = Column(String, nullable=True)
@@ -67,6 +71,12 @@ class Message(Base):
     sender = relationship('User', foreign_keys=[sender_id])
     receiver = relationship('User', foreign_keys=[receiver_id])
 
+    __table_args__ = (
+        # Serves both directions of a (sender, receiver) pair, ordered by (timestamp, id)
+        Index("ix_message_sender_id_receiver_id_timestamp", "sender_id", "receiver_id", "timestamp", "id"),
+        Index("ix_message_receiver_id", "receiver_id"),
+    )
+
     def __repr__(self):
         return f"Message(sender_id={self.sender_id}, receiver_id={self.receiver_id}, content={self.content})"
     
@@ -82,11 +92,75 @@ class Conversation(Base):
     user_1_active = Column(Boolean, nullable=False)
     user_2_active = Column(Boolean, nullable=False)
     timestamp = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()"))
+    # Denormalised pointer to the newest message, kept up to date by send_message
+    last_message_id = Column(Integer, ForeignKey('message.id'), nullable=True)
+    last_message_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
     user_1 = relationship('User', foreign_keys=[user_1_id])
     user_2 = relationship('User', foreign_keys=[user_2_id])
     last_message_read1 = relationship('Message', foreign_keys=[user_1_last_message_read_id])
     last_message_read2 = relationship('Message', foreign_keys=[user_2_last_message_read_id])
+    last_message = relationship('Message', foreign_keys=[last_message_id])
+
+    __table_args__ = (
+        # One index per side, so `user_1_id = :id OR user_2_id = :id` becomes a BitmapOr
+        Index("ix_conversation_user_1_id_user_2_id", "user_1_id", "user_2_id"),
+        Index("ix_conversation_user_2_id_user_1_id", "user_2_id", "user_1_id"),
+    )
+
+    def __repr__(self):
+        return f"Conversation(user_1_id={self.user_1_id}, user_2_id={self.user_2_id}, status={self.status})"
+
+
+# A side effect on Baserow/BPMN, written in the same transaction as the Postgres change
+class OutboxJob(Base):
+    __tablename__ = "outbox_job"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    # pending -> running -> done | failed, or pending -> cancelled
+    status = Column(String, nullable=False, server_default=text("'pending'"))
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    max_attempts = Column(Integer, nullable=False)
+    # For running jobs this is the end of the worker's lease
+    next_attempt_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()"))
+    last_error = Column(Text, nullable=True)
+    result = Column(JSONB, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()"))
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()"))
+
+    __table_args__ = (
+        Index("ix_outbox_job_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    def __repr__(self):
+        return f"OutboxJob(id={self.id}, kind={self.kind}, status={self.status})"
+
+
+# Token bucket of the shared (Postgres) login rate limiter, see app/rate_limit.py
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_bucket"
+    # sha256 of the limited key (IP address or email), never the raw value
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Whether the last attempt was allowed
+    allowed = Column(Boolean, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()"))
+
+    __table_args__ = (
+        Index("ix_rate_limit_bucket_updated_at", "updated_at"),
+    )
+
+    def __repr__(self):
+        return f"RateLimitBucket(key={self.key}, tokens={self.tokens})"
+
+
+# Change counter per table, bumped by a statement trigger on every write (see
+# migration 0006). Lists are tagged with it so polls can be answered with 304.
+class TableVersion(Base):
+    __tablename__ = "table_version"
+    table_name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, server_default=text("0"))
 
     def __repr__(self):
-        return f"Conversation(user_1_id={self.user_1_id}, user_2_id={self.user_2_id}, status={self.status})"
\ No newline at end of file
+        return f"TableVersion(table_name={self.table_name}, version={self.version})"
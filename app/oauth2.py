@@ -4,18 +4,27 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from jose import JWTError
 
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple, Type
+import hashlib
+import logging
+import threading
+import time
 
 import app.db as db
 import app.schemas as schemas
 import app.models as models
 
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached, with_polymorphic
 
 from app.config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth")
 
+logger = logging.getLogger(__name__)
+
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.PASS_HASHING_ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
@@ -43,12 +52,104 @@ def verify_access_token(token: str, credentials_exception):
         user_email = payload.get("user_email")
         if id is None and user_email is None:
             raise credentials_exception
-        token_data = schemas.TokenData(user_id=id, user_email=user_email)
+        exp = payload.get("exp")
+        token_data = schemas.TokenData(
+            user_id=id,
+            user_email=user_email,
+            account_type=payload.get("account_type"),
+            expires_at=datetime.fromtimestamp(exp, tz=timezone.utc) if exp else None,
+        )
     except JWTError:
         raise credentials_exception
     return token_data
 
 
+# User LEFT OUTER JOIN admin LEFT OUTER JOIN student, so the principal comes back
+# as an Admin or Student with all of its columns from a single statement
+ANY_USER = with_polymorphic(models.User, "*")
+
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of authenticated principals, keyed by a hash of the token.
+
+    Entries hold a snapshot of the user's columns rather than the ORM object, so
+    every request gets its own instance attached to its own session. Entries
+    expire after `ttl` seconds or when the token does, whichever comes first.
+    Each worker process has its own cache, so invalidation is per process and
+    other workers catch up within `ttl`.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # token hash -> (expires_at, user_id, model, column values), in LRU order
+        self._entries: OrderedDict = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Type[models.User], dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user_id, model, values = entry
+            if time.time() >= expires_at:
+                self._remove(key, user_id)
+                return None
+            self._entries.move_to_end(key)
+            return model, values
+
+    def put(self, key: str, user: models.User, token_expires_at: Optional[datetime]):
+        model = type(user)
+        values = {
+            attr.key: getattr(user, attr.key) for attr in inspect(model).column_attrs
+        }
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at.timestamp())
+
+        with self._lock:
+            self._entries[key] = (expires_at, user.id, model, values)
+            self._entries.move_to_end(key)
+            self._tokens_by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest_key, oldest_entry = next(iter(self._entries.items()))
+                self._remove(oldest_key, oldest_entry[1])
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(key, user_id)
+
+    def _remove(self, key: str, user_id: int):
+        self._entries.pop(key, None)
+        keys = self._tokens_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tokens_by_user[user_id]
+
+
+principal_cache = PrincipalCache(
+    max_size=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+
+def attach_principal(
+    db: Session, model: Type[models.User], values: dict
+) -> models.User:
+    # Rebuild the user as a persistent instance of this session without a query
+    user = model(**values)
+    make_transient_to_detached(user)
+    db.add(user)
+    return user
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme), db: Session = Depends(db.get_db)
 ):
@@ -57,6 +158,43 @@ def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cache_key = principal_cache.key(token)
+    cached = principal_cache.get(cache_key)
+    if cached is not None:
+        return attach_principal(db, *cached)
+
     token = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.user_id).first()
+    # The role comes from the row, not from the account_type claim
+    user = db.execute(
+        select(ANY_USER).where(ANY_USER.id == token.user_id)
+    ).scalar_one_or_none()
+    if user is None:
+        raise credentials_exception
+    principal_cache.put(cache_key, user, token.expires_at)
     return user
+
+
+def require_admin(
+    current_user: models.User = Depends(get_current_user),
+) -> models.Admin:
+    if not isinstance(current_user, models.Admin):
+        logger.warning(f"Unauthorized admin access attempt by user {current_user.id}.")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Forbidden",
+        )
+    return current_user
+
+
+def require_student(
+    current_user: models.User = Depends(get_current_user),
+) -> models.Student:
+    if not isinstance(current_user, models.Student):
+        logger.warning(
+            f"Unauthorized student access attempt by user {current_user.id}."
+        )
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Forbidden",
+        )
+    return current_user
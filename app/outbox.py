@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import models
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.connectors.baserow_service_connector import (
+    BW_add_student_to_baserow,
+    BW_delete_student_by_email,
+    BW_find_student_by_email,
+    baserow_cache,
+)
+from app.connectors.bpmn_engine_service_connector import BE_remove_instance_by_id
+
+logger = logging.getLogger(__name__)
+
+BASEROW_ADD_STUDENT = "baserow.add_student"
+BASEROW_DELETE_STUDENT = "baserow.delete_student"
+BPMN_REMOVE_INSTANCE = "bpmn.remove_instance"
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job cannot succeed."""
+
+
+def enqueue(db: AsyncSession, kind: str, payload: dict) -> models.OutboxJob:
+    """
+    Add a job to the session. It is committed (or rolled back) together with
+    the caller's own changes.
+    """
+    job = models.OutboxJob(
+        kind=kind, payload=payload, max_attempts=settings.OUTBOX_MAX_ATTEMPTS
+    )
+    db.add(job)
+    return job
+
+
+async def cancel_add_student_jobs(db: AsyncSession, student_ids: List[int]) -> List[int]:
+    """
+    Cancel the pending Baserow add jobs of students about to be deleted, so an
+    add can't run after the delete and leave an orphaned row. Runs in the
+    caller's transaction. A job that is already running finds the student gone
+    when it records the baserow_id and removes its row itself.
+    """
+    if not student_ids:
+        return []
+    result = await db.execute(
+        update(models.OutboxJob)
+        .where(
+            models.OutboxJob.kind == BASEROW_ADD_STUDENT,
+            models.OutboxJob.status == "pending",
+            models.OutboxJob.payload["student_id"].as_integer().in_(student_ids),
+        )
+        .values(status="cancelled", updated_at=datetime.now(timezone.utc))
+        .returning(models.OutboxJob.id)
+    )
+    return list(result.scalars().all())
+
+
+def raise_for_upstream_status(exc: httpx.HTTPStatusError):
+    # Client errors other than rate limiting won't go away on retry
+    code = exc.response.status_code
+    if 400 <= code < 500 and code != 429:
+        raise PermanentJobError(f"{code} {exc.response.text[:500]}") from exc
+    raise exc
+
+
+async def add_student_to_baserow(db: AsyncSession, payload: dict) -> dict:
+    student_id, email = payload["student_id"], payload["data"]["email"]
+    result = await db.execute(
+        select(models.Student.baserow_id).where(models.Student.id == student_id)
+    )
+    student = result.first()
+    if student is None:
+        return {"skipped": "student was deleted"}
+    if student.baserow_id is not None:
+        return {"baserow_id": student.baserow_id}
+    # Don't hold a connection (or anything else) during the upstream calls
+    await db.commit()
+
+    # The lease keeps other workers off this job while it runs. An earlier
+    # attempt may have added the row and failed afterwards, so look it up first
+    try:
+        row = await BW_find_student_by_email(email)
+        if row is None:
+            row = (await BW_add_student_to_baserow(payload["data"]))["data"]
+    except httpx.HTTPStatusError as exc:
+        raise_for_upstream_status(exc)
+
+    baserow_id = row["id"]
+    result = await db.execute(
+        update(models.Student)
+        .where(models.Student.id == student_id, models.Student.baserow_id.is_(None))
+        .values(baserow_id=baserow_id)
+    )
+    baserow_cache.invalidate("Student")
+    if result.rowcount == 0:
+        student = await db.scalar(
+            select(models.Student.id).where(models.Student.id == student_id)
+        )
+        if student is None:
+            # Deleted while the row was being added, so the delete may have run
+            # before the row existed; queue another, committed with this job
+            enqueue(db, BASEROW_DELETE_STUDENT, {"email": email})
+            return {"skipped": "student was deleted", "orphan_baserow_id": baserow_id}
+    return {"baserow_id": baserow_id}
+
+
+async def delete_student_from_baserow(db: AsyncSession, payload: dict) -> dict:
+    try:
+        response = await BW_delete_student_by_email(payload["email"])
+    except httpx.HTTPStatusError as exc:
+        raise_for_upstream_status(exc)
+
+    if not response or response.get("status") != True:
+        raise Exception("Error deleting student from Baserow")
+    baserow_cache.invalidate("Student")
+    return {"email": payload["email"]}
+
+
+async def remove_bpmn_instance(db: AsyncSession, payload: dict) -> dict:
+    try:
+        await BE_remove_instance_by_id(payload["instance_id"])
+    except httpx.HTTPStatusError as exc:
+        raise_for_upstream_status(exc)
+    return {"instance_id": payload["instance_id"]}
+
+
+Handler = Callable[[AsyncSession, dict], Awaitable[Optional[dict]]]
+
+HANDLERS: Dict[str, Handler] = {
+    BASEROW_ADD_STUDENT: add_student_to_baserow,
+    BASEROW_DELETE_STUDENT: delete_student_from_baserow,
+    BPMN_REMOVE_INSTANCE: remove_bpmn_instance,
+}
+
+
+class OutboxWorker:
+    """
+    Drains the outbox table. Jobs are claimed with SELECT ... FOR UPDATE SKIP
+    LOCKED, so any number of workers (one per uvicorn process) can run side by
+    side. A claimed job is leased until `lease` seconds from now; if its worker
+    dies, the job becomes claimable again once the lease runs out. Failed jobs
+    are retried with exponential backoff and jitter until `max_attempts`.
+
+    Delivery is at-least-once, so handlers should tolerate being repeated.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        handlers: Optional[Dict[str, Handler]] = None,
+        poll_interval: float = settings.OUTBOX_POLL_INTERVAL,
+        batch_size: int = settings.OUTBOX_BATCH_SIZE,
+        base_delay: float = settings.OUTBOX_BASE_DELAY,
+        max_delay: float = settings.OUTBOX_MAX_DELAY,
+        lease: float = settings.OUTBOX_LEASE,
+    ):
+        self.session_factory = session_factory
+        self.handlers = handlers if handlers is not None else HANDLERS
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        # Created in run(), so it belongs to the running event loop
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    async def claim(self) -> List[int]:
+        now = datetime.now(timezone.utc)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(models.OutboxJob.id)
+                .where(
+                    or_(
+                        models.OutboxJob.status == "pending",
+                        models.OutboxJob.status == "running",
+                    ),
+                    models.OutboxJob.next_attempt_at <= now,
+                )
+                .order_by(models.OutboxJob.next_attempt_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            job_ids = list(result.scalars().all())
+            if job_ids:
+                await db.execute(
+                    update(models.OutboxJob)
+                    .where(models.OutboxJob.id.in_(job_ids))
+                    .values(
+                        status="running",
+                        next_attempt_at=now + timedelta(seconds=self.lease),
+                        updated_at=now,
+                    )
+                )
+            await db.commit()
+        return job_ids
+
+    async def process(self, job_id: int):
+        async with self.session_factory() as db:
+            job = await db.get(models.OutboxJob, job_id)
+            if job is None:
+                return
+            kind = job.kind
+            handler = self.handlers.get(kind)
+
+            try:
+                if handler is None:
+                    raise PermanentJobError(f"No handler for job kind {kind}")
+                result = await handler(db, job.payload)
+            except Exception as e:
+                # Discard whatever the handler changed, then record the failure
+                await db.rollback()
+                job = await db.get(models.OutboxJob, job_id)
+                job.attempts += 1
+                job.last_error = str(e)[:2000] or e.__class__.__name__
+                now = datetime.now(timezone.utc)
+
+                if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+                    job.status = "failed"
+                    logger.error(f"Outbox job {job_id} ({kind}) failed: {e}")
+                else:
+                    delay = self.backoff(job.attempts)
+                    job.status = "pending"
+                    job.next_attempt_at = now + timedelta(seconds=delay)
+                    logger.warning(
+                        f"Outbox job {job_id} ({kind}) attempt {job.attempts} "
+                        f"failed, retrying in {delay:.1f}s: {e}"
+                    )
+            else:
+                now = datetime.now(timezone.utc)
+                job.attempts += 1
+                job.status = "done"
+                job.result = result
+                job.last_error = None
+                logger.info(f"Outbox job {job_id} ({kind}) done.")
+
+            job.updated_at = now
+            await db.commit()
+
+    async def run_once(self) -> int:
+        """Claim and process one batch. Returns the number of jobs processed."""
+        job_ids = await self.claim()
+        await asyncio.gather(*(self.process(job_id) for job_id in job_ids))
+        return len(job_ids)
+
+    def wake(self):
+        # Called after a commit that enqueued jobs, to skip the poll delay
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            try:
+                processed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                processed = 0
+
+            if processed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,119 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RepeatedQueryError(Exception):
+    """A request ran the same statement more often than allowed (likely N+1)."""
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+
+
+# Holds a mutable QueryStats, so queries run in the threadpool or in the async
+# engine's greenlets are added to the stats of the request that started them
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def redact(parameters):
+    # Keep the shape of the parameters (names and types), never the values
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return [redact(parameters[0]), f"... {len(parameters)} rows"]
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._query_start
+
+    if duration * 1000 >= settings.SQL_SLOW_QUERY_MS:
+        logger.warning(
+            f"Slow query ({duration * 1000:.1f} ms): {statement[:2000]} "
+            f"params={redact(parameters)}"
+        )
+
+    stats = _current.get()
+    if stats is None:
+        # Outside of a request (outbox worker, scripts)
+        return
+    stats.count += 1
+    stats.duration += duration
+
+    mode = settings.SQL_REPEATED_QUERY_MODE
+    if mode == "off":
+        return
+    stats.shapes[statement] += 1
+    # Checked once per shape, on the first repetition over the threshold
+    if stats.shapes[statement] == settings.SQL_REPEATED_QUERY_THRESHOLD + 1:
+        message = (
+            f"Statement repeated more than {settings.SQL_REPEATED_QUERY_THRESHOLD} "
+            f"times in one request: {statement[:500]}"
+        )
+        if mode == "raise":
+            raise RepeatedQueryError(message)
+        logger.warning(message)
+
+
+def instrument_engine(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+    """
+    Pure ASGI middleware that collects the queries of each request and reports
+    them in a Server-Timing header, e.g. `db;dur=12.3;desc="4 queries"`.
+
+    The header is written when the response starts, so queries run while a
+    StreamingResponse is being sent are not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                timing = (
+                    f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
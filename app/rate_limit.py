@@ -0,0 +1,220 @@
+import hashlib
+import ipaddress
+import logging
+import math
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import case, delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app import models
+from app.config import settings
+from app.db import get_async_engine
+from app.metrics import LOGIN_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketBackend(ABC):
+    """
+    Storage for token buckets. `take` removes `cost` tokens from the bucket if
+    it has them and returns 0, otherwise it returns the number of seconds until
+    it will have them. Buckets start full and refill at `rate` tokens per second
+    up to `capacity`.
+    """
+
+    @abstractmethod
+    async def take(
+        self, key: str, capacity: float, rate: float, cost: float = 1.0
+    ) -> float:
+        ...
+
+
+class MemoryBackend(TokenBucketBackend):
+    """
+    Per worker process. At most `max_keys` buckets are kept, the least recently
+    used ones are dropped first (they come back full).
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> (tokens, monotonic time of the last update), in LRU order
+        self._buckets: OrderedDict = OrderedDict()
+
+    async def take(
+        self, key: str, capacity: float, rate: float, cost: float = 1.0
+    ) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class PostgresBackend(TokenBucketBackend):
+    """
+    Shared by every worker and instance. Each `take` is a single upsert, so
+    concurrent attempts on the same key are serialised by the row lock.
+    Buckets that have been idle long enough to be full again are deleted now
+    and then, which keeps the table small.
+    """
+
+    CLEANUP_PROBABILITY = 0.01
+
+    def __init__(self, idle_ttl: float):
+        self.idle_ttl = idle_ttl
+
+    async def take(
+        self, key: str, capacity: float, rate: float, cost: float = 1.0
+    ) -> float:
+        bucket = models.RateLimitBucket.__table__
+        elapsed = func.extract("epoch", func.now() - bucket.c.updated_at)
+        refilled = func.least(capacity, bucket.c.tokens + elapsed * rate)
+        allowed = refilled >= cost
+
+        statement = (
+            insert(bucket)
+            .values(key=key, tokens=capacity - cost, allowed=True, updated_at=func.now())
+            .on_conflict_do_update(
+                index_elements=[bucket.c.key],
+                set_={
+                    "tokens": case((allowed, refilled - cost), else_=refilled),
+                    "allowed": allowed,
+                    "updated_at": func.now(),
+                },
+            )
+            .returning(bucket.c.tokens, bucket.c.allowed)
+        )
+
+        async with get_async_engine().begin() as connection:
+            tokens, was_allowed = (await connection.execute(statement)).one()
+            if random.random() < self.CLEANUP_PROBABILITY:
+                await connection.execute(
+                    delete(bucket).where(
+                        bucket.c.updated_at
+                        < func.now() - text(f"interval '{int(self.idle_ttl)} seconds'")
+                    )
+                )
+
+        if was_allowed:
+            return 0.0
+        return (cost - tokens) / rate
+
+
+def network_of(ip: str, ipv4_prefix: int, ipv6_prefix: int) -> str:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    prefix = ipv4_prefix if address.version == 4 else ipv6_prefix
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+class LoginRateLimiter:
+    """
+    Two token buckets per login attempt: one for the client IP (a burst from one
+    source) and one for the email from the client's network (guessing one
+    account's password). Keys are hashed, so neither store holds raw IPs or
+    emails.
+
+    The email bucket is spent before the credentials are checked. Keying it by
+    network as well means a stranger can only lock an account out for their
+    own network, at the cost of a guesser spread over many networks getting
+    more attempts.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[TokenBucketBackend],
+        ip_burst: int,
+        ip_per_minute: float,
+        email_burst: int,
+        email_per_minute: float,
+        ipv4_prefix: int = 24,
+        ipv6_prefix: int = 64,
+    ):
+        # None turns the limiter off
+        self.backend = backend
+        self.ip_burst = ip_burst
+        self.ip_rate = ip_per_minute / 60
+        self.email_burst = email_burst
+        self.email_rate = email_per_minute / 60
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+
+    @staticmethod
+    def key(kind: str, value: str) -> str:
+        return hashlib.sha256(f"login:{kind}:{value}".encode()).hexdigest()
+
+    async def _take(self, kind: str, value: str, capacity: int, rate: float) -> float:
+        try:
+            return await self.backend.take(self.key(kind, value), capacity, rate)
+        except Exception as e:
+            # A limiter outage must not lock everybody out
+            logger.error(f"Login rate limiter unavailable: {e}")
+            return 0.0
+
+    async def check(self, request: Request, email: str):
+        if self.backend is None:
+            return
+
+        ip = request.client.host if request.client else "unknown"
+        network = network_of(ip, self.ipv4_prefix, self.ipv6_prefix)
+        buckets = (
+            ("ip", ip, self.ip_burst, self.ip_rate),
+            (
+                "email",
+                f"{email.strip().lower()}:{network}",
+                self.email_burst,
+                self.email_rate,
+            ),
+        )
+        for kind, value, capacity, rate in buckets:
+            wait = await self._take(kind, value, capacity, rate)
+            if wait > 0:
+                LOGIN_RATE_LIMITED.labels(kind).inc()
+                logger.warning(f"Login rate limited by {kind} bucket for {ip}.")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many login attempts, please try again later.",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+
+
+def build_backend() -> Optional[TokenBucketBackend]:
+    if settings.LOGIN_RATE_LIMIT_BACKEND == "off":
+        return None
+    if settings.LOGIN_RATE_LIMIT_BACKEND == "postgres":
+        # Slowest refill, after which every bucket is full again
+        idle_ttl = max(
+            settings.LOGIN_IP_BURST / settings.LOGIN_IP_PER_MINUTE,
+            settings.LOGIN_EMAIL_BURST / settings.LOGIN_EMAIL_PER_MINUTE,
+        ) * 60
+        return PostgresBackend(idle_ttl=idle_ttl)
+    return MemoryBackend(max_keys=settings.LOGIN_RATE_LIMIT_MAX_KEYS)
+
+
+login_limiter = LoginRateLimiter(
+    build_backend(),
+    ip_burst=settings.LOGIN_IP_BURST,
+    ip_per_minute=settings.LOGIN_IP_PER_MINUTE,
+    email_burst=settings.LOGIN_EMAIL_BURST,
+    email_per_minute=settings.LOGIN_EMAIL_PER_MINUTE,
+    ipv4_prefix=settings.LOGIN_EMAIL_IPV4_PREFIX,
+    ipv6_prefix=settings.LOGIN_EMAIL_IPV6_PREFIX,
+)
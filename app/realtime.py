@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+import asyncpg
+import orjson
+from fastapi import WebSocket, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import DIRECT_SQLALCHEMY_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "chat_events"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+
+def publish(db: Session, event_type: str, recipients: List[int], data: dict):
+    """
+    Queue an event for the given users in the current transaction. Postgres only
+    delivers it on commit, to the listener of every worker, and drops it on
+    rollback.
+    """
+    event = {"type": event_type, "recipients": recipients, "data": data}
+    payload = orjson.dumps(jsonable_encoder(event))
+    if len(payload) > MAX_PAYLOAD_BYTES:
+        # Too big to send inline, clients fetch it by id instead
+        event["data"] = {"id": data.get("id")}
+        event["truncated"] = True
+        payload = orjson.dumps(jsonable_encoder(event))
+
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": payload.decode()},
+    )
+
+
+class Subscriber:
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = asyncio.Event()
+
+    def offer(self, event: str):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A consumer this far behind is disconnected rather than buffered forever
+            self.overflowed.set()
+
+    async def send_events(self):
+        while True:
+            event = await self.queue.get()
+            # Text frames, so browsers get a string rather than a Blob
+            await self.websocket.send_text(event)
+
+
+class Hub:
+    """Fans events out to the WebSocket connections of this worker."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+
+    def subscribe(self, websocket: WebSocket, user_id: int) -> Subscriber:
+        subscriber = Subscriber(websocket, user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+
+    def dispatch(self, payload: str):
+        try:
+            event = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            logger.error(f"Invalid realtime event payload: {payload[:200]}")
+            return
+
+        recipients = event.pop("recipients", [])
+        # Decoded once, shared by every subscriber
+        message = orjson.dumps(event).decode()
+        for user_id in set(recipients):
+            for subscriber in list(self._subscribers.get(user_id, ())):
+                subscriber.offer(message)
+
+    async def serve(self, websocket: WebSocket, user_id: int):
+        subscriber = self.subscribe(websocket, user_id)
+        tasks = [
+            asyncio.ensure_future(subscriber.send_events()),
+            asyncio.ensure_future(self._receive_until_closed(websocket)),
+            asyncio.ensure_future(subscriber.overflowed.wait()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            if subscriber.overflowed.is_set():
+                logger.warning(f"Closing slow realtime consumer for user {user_id}")
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except Exception as e:
+            logger.info(f"Realtime connection for user {user_id} ended: {e}")
+        finally:
+            for task in tasks:
+                if task.done() and not task.cancelled():
+                    task.exception()  # mark a send/receive error as retrieved
+                task.cancel()
+            self.unsubscribe(subscriber)
+
+    async def _receive_until_closed(self, websocket: WebSocket):
+        # Clients don't send anything meaningful, this only notices disconnects
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+
+class PostgresListener:
+    """Runs LISTEN on the events channel and hands every notification to the hub."""
+
+    def __init__(self, hub: Hub, dsn: str, reconnect_delay: float):
+        self.hub = hub
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self._task: Optional[asyncio.Task] = None
+
+    def _on_notification(self, connection, pid, channel, payload):
+        self.hub.dispatch(payload)
+
+    async def _listen(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(CHANNEL, self._on_notification)
+                logger.info(f"Listening for realtime events on {CHANNEL}")
+
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await closed.wait()
+                logger.warning("Realtime listener connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Realtime listener error: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+hub = Hub(queue_size=settings.WS_QUEUE_SIZE)
+listener = PostgresListener(
+    hub, DIRECT_SQLALCHEMY_DATABASE_URL, settings.WS_LISTEN_RECONNECT_DELAY
+)
@@ -0,0 +1,22 @@
+from typing import Any
+
+from fastapi import Response, status
+from pydantic import TypeAdapter
+
+
+def orm_response(
+    adapter: TypeAdapter, data: Any, status_code: int = status.HTTP_200_OK
+) -> Response:
+    """
+    Validates ORM objects once (from_attributes) and serialises the result
+    straight to JSON bytes in pydantic-core.
+
+    Returning a Response skips FastAPI's own response_model validation and
+    encoding pass. Routes keep their response_model for the OpenAPI schema.
+    """
+    value = adapter.validate_python(data, from_attributes=True)
+    return Response(
+        content=adapter.dump_json(value),
+        status_code=status_code,
+        media_type="application/json",
+    )
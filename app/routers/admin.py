@@ -1,19 +1,35 @@
-from fastapi import status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import status, HTTPException, Depends, APIRouter, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Integer, any_, bindparam, delete, insert, or_, select, union
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, List
+import csv
+import io
+import orjson
 
 from app import models
 from app import schemas
-from app import utils
-from app.db import get_db
+from app.hashing import hasher
+from app.db import get_async_db
 from app import oauth2
+from app.routers.student import baserow_student_payload
+from app.outbox import (
+    BASEROW_ADD_STUDENT,
+    BASEROW_DELETE_STUDENT,
+    BPMN_REMOVE_INSTANCE,
+    cancel_add_student_jobs,
+    enqueue,
+    outbox_worker,
+)
 
 import logging
 from app.connectors.baserow_service_connector import (
-    BW_get_data,
-    BW_delete_student_by_email,
+    BW_iter_pages,
+    baserow_cache,
 )
-from app.connectors.bpmn_engine_service_connector import BE_remove_instance_by_id
+from app.connectors.resilience import UpstreamUnavailable
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -22,16 +38,18 @@ router = APIRouter(prefix="/admin", tags=["Admin"])
 
 
 @router.post("", status_code=status.HTTP_201_CREATED, response_model=schemas.Admin)
-async def create_admin(admin: schemas.AdminCreate, db: Session = Depends(get_db)):
+async def create_admin(
+    admin: schemas.AdminCreate, db: AsyncSession = Depends(get_async_db)
+):
     admin_data = admin.model_dump()
-    admin_data["password"] = utils.hash(admin_data["password"])
+    admin_data["password"] = await hasher.hash(admin_data["password"])
     new_admin = models.Admin(**admin_data)
 
     try:
         # ADD to Postgres
         db.add(new_admin)
-        db.commit()
-        db.refresh(new_admin)
+        await db.commit()
+        await db.refresh(new_admin)
     except Exception as e:
         logger.error(f"Error adding admin to Postgres: {e}")
         raise HTTPException(
@@ -43,85 +61,125 @@ async def create_admin(admin: schemas.AdminCreate, db: Session = Depends(get_db)
     return new_admin
 
 
+def merge_students_page(students_page: List[dict], db_students_dict: dict):
+    merged = []
+    for student in students_page:
+        # Copy the row, the cached page is shared between requests
+        student = dict(student)
+        student_baserow_id = student.get("id")
+        if student_baserow_id in db_students_dict:
+            student["process_instance_id"] = db_students_dict[student_baserow_id][
+                "process_instance_id"
+            ]
+            student["postgres_id"] = db_students_dict[student_baserow_id][
+                "postgres_id"
+            ]
+        merged.append(student)
+    return merged
+
+
+async def stream_students(
+    first_page: List[dict],
+    pages: AsyncIterator[List[dict]],
+    db_students_dict: dict,
+    ndjson: bool,
+):
+    # One chunk per Baserow page, either NDJSON lines or pieces of a JSON array
+    first_chunk = True
+    if not ndjson:
+        yield b"["
+
+    try:
+        students_page = first_page
+        while True:
+            rows = [
+                orjson.dumps(student)
+                for student in merge_students_page(students_page, db_students_dict)
+            ]
+            if rows:
+                if ndjson:
+                    yield b"\n".join(rows) + b"\n"
+                else:
+                    yield (b"" if first_chunk else b",") + b",".join(rows)
+                    first_chunk = False
+            students_page = await pages.__anext__()
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        # Headers are already sent, so the response is cut off instead
+        logger.error(f"Error streaming students data: {e}")
+        raise
+    finally:
+        await pages.aclose()
+
+    if not ndjson:
+        yield b"]"
+    logger.info("Successfully fetched and processed students data.")
+
+
 @router.get("/students", status_code=status.HTTP_200_OK)
 async def get_students_data(
-    db: Session = Depends(get_db),
-    current_user: models.Admin = Depends(oauth2.get_current_user),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Admin = Depends(oauth2.require_admin),
 ):
-    if isinstance(current_user, models.Admin):
-        try:
-            # 1. Fetch the required fields from PostgreSQL
-            db_students = db.query(
+    try:
+        # 1. Fetch the required fields from PostgreSQL
+        result = await db.execute(
+            select(
                 models.Student.id,
                 models.Student.baserow_id,
                 models.Student.process_instance_id,
-            ).all()
-            db_students_dict = {
-                student.baserow_id: {
-                    "postgres_id": student.id,
-                    "process_instance_id": student.process_instance_id,
-                }
-                for student in db_students
+            )
+        )
+        db_students = result.all()
+        db_students_dict = {
+            student.baserow_id: {
+                "postgres_id": student.id,
+                "process_instance_id": student.process_instance_id,
             }
+            for student in db_students
+        }
 
-            # 2. Fetch data from Baserow
-            response = await BW_get_data("Student")
-            students_data = response["data"]["results"]
-
-            # 3. Merge the data
-            for student in students_data:
-                student_baserow_id = student.get("id")
-                if student_baserow_id in db_students_dict:
-                    student["process_instance_id"] = db_students_dict[
-                        student_baserow_id
-                    ]["process_instance_id"]
-                    student["postgres_id"] = db_students_dict[student_baserow_id][
-                        "postgres_id"
-                    ]
-                else:
-                    pass
-
-            logger.info("Successfully fetched and processed students data.")
-            return students_data
+        # 2. Fetch the first Baserow page up front, so upstream errors still
+        # turn into a proper error response
+        pages = BW_iter_pages("Student")
+        first_page = await pages.__anext__()
 
-        except Exception as e:
-            logger.error(f"Error fetching and processing students data: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error fetching and processing students data - {e}",
-            )
-    else:
-        logger.warning("Unauthorized access attempt to get students data.")
+    except UpstreamUnavailable as e:
+        logger.warning(f"Baserow unavailable, not fetching students data: {e}")
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Unauthorized",
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Baserow is unavailable - {e}",
+            headers={"Retry-After": "5"},
         )
+    except Exception as e:
+        logger.error(f"Error fetching and processing students data: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching and processing students data - {e}",
+        )
+
+    # 3. Merge the remaining pages as they arrive and stream the result
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    return StreamingResponse(
+        stream_students(first_page, pages, db_students_dict, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+    )
 
 
 @router.delete("/students/{email}", status_code=status.HTTP_200_OK)
 async def delete_student(
     email: str,
-    db: Session = Depends(get_db),
-    current_user: models.Admin = Depends(oauth2.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Admin = Depends(oauth2.require_admin),
 ):
-    if not isinstance(current_user, models.Admin):
-        logger.warning("Unauthorized access attempt to delete student.")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Unauthorized",
-        )
-
     try:
-        # 1. Delete the student from Baserow
-        baserow_response = await BW_delete_student_by_email(email)
-
-        if not baserow_response or baserow_response.get("status") != True:
-            raise Exception("Error deleting student from Baserow")
-        else:
-            logger.info(f"Student {email} deleted from Baserow!")
-
-        # 2. Retrieve the process instance ID for the student from Postgres
-        student = db.query(models.Student).filter(models.Student.email == email).first()
+        # 1. Retrieve the student from Postgres
+        result = await db.execute(
+            select(models.Student).where(models.Student.email == email)
+        )
+        student = result.scalars().first()
 
         if not student:
             logger.warning("Student not found in Postgres.")
@@ -130,24 +188,28 @@ async def delete_student(
                 detail="Student not found in Postgres.",
             )
 
-        process_instance_id = student.process_instance_id
-        bpmn_engine_response = await BE_remove_instance_by_id(process_instance_id)
-        logger.info(f"Process instance {process_instance_id} deleted from BPMN Engine!")
-
-        # 3. Delete the student from Postgres
-        student = db.query(models.Student).filter(models.Student.email == email).first()
-
-        if not student:
-            logger.warning("Student not found in Postgres.")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Student not found in Postgres.",
+        # 2. Queue the Baserow and BPMN Engine deletions in the same transaction,
+        # after dropping an add to Baserow that hasn't run yet
+        await cancel_add_student_jobs(db, [student.id])
+        jobs = [enqueue(db, BASEROW_DELETE_STUDENT, {"email": email})]
+        if student.process_instance_id is not None:
+            jobs.append(
+                enqueue(
+                    db,
+                    BPMN_REMOVE_INSTANCE,
+                    {"instance_id": student.process_instance_id},
+                )
             )
 
-        db.delete(student)
-        db.commit()
+        # 3. Delete the student from Postgres
+        await db.delete(student)
+        await db.commit()
+        oauth2.principal_cache.invalidate_user(student.id)
+        outbox_worker.wake()
         logger.info(f"Student {email} deleted from Postgres!")
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting student: {e}")
         raise HTTPException(
@@ -155,7 +217,285 @@ async def delete_student(
             detail=f"Error deleting student - {e}",
         )
 
-    return {"detail": "Student deleted successfully"}
+    return {
+        "detail": "Student deleted successfully",
+        "job_ids": [job.id for job in jobs],
+    }
+
+
+@router.post(
+    "/students/bulk-delete",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.StudentBulkDeleteReport,
+)
+async def bulk_delete_students(
+    bulk_delete: schemas.StudentBulkDelete,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Admin = Depends(oauth2.require_admin),
+):
+    emails = list(dict.fromkeys(bulk_delete.emails))
+    results = {}
+
+    # 1. Retrieve all the students from Postgres at once
+    result = await db.execute(
+        select(
+            models.Student.id,
+            models.Student.email,
+            models.Student.process_instance_id,
+        ).where(models.Student.email.in_(emails))
+    )
+    students = {student.email: student for student in result.all()}
+    for email in emails:
+        if email not in students:
+            results[email] = {
+                "email": email,
+                "status": "not_found",
+                "detail": "Student not found in Postgres.",
+            }
+
+    # 2. Students who still have messages or conversations can't be deleted from
+    # Postgres (foreign keys), report them instead of failing the whole batch
+    if students:
+        ids = [student.id for student in students.values()]
+        result = await db.execute(
+            union(
+                select(models.Message.sender_id).where(
+                    models.Message.sender_id.in_(ids)
+                ),
+                select(models.Message.receiver_id).where(
+                    models.Message.receiver_id.in_(ids)
+                ),
+                select(models.Conversation.user_1_id).where(
+                    models.Conversation.user_1_id.in_(ids)
+                ),
+                select(models.Conversation.user_2_id).where(
+                    models.Conversation.user_2_id.in_(ids)
+                ),
+            )
+        )
+        referenced = set(result.scalars().all())
+        for email, student in students.items():
+            if student.id in referenced:
+                results[email] = {
+                    "email": email,
+                    "status": "failed",
+                    "detail": "Student has messages or conversations, not deleted.",
+                }
+
+    # 3. Delete the rest from Postgres in one statement per table, queueing
+    # their Baserow and BPMN Engine deletions in the same transaction. The
+    # outbox worker fans the upstream calls out, a bounded number at a time
+    deleted = [
+        student for email, student in students.items() if email not in results
+    ]
+    if deleted:
+        ids = bindparam(
+            "ids", [student.id for student in deleted], type_=ARRAY(Integer)
+        )
+        jobs = {}
+        try:
+            # Adds to Baserow that haven't run yet would re-add the rows
+            await cancel_add_student_jobs(db, [student.id for student in deleted])
+            await db.execute(
+                delete(models.Student.__table__).where(
+                    models.Student.__table__.c.id == any_(ids)
+                )
+            )
+            await db.execute(
+                delete(models.User.__table__).where(
+                    models.User.__table__.c.id == any_(ids)
+                )
+            )
+            for student in deleted:
+                jobs[student.email] = [
+                    enqueue(db, BASEROW_DELETE_STUDENT, {"email": student.email})
+                ]
+                if student.process_instance_id is not None:
+                    jobs[student.email].append(
+                        enqueue(
+                            db,
+                            BPMN_REMOVE_INSTANCE,
+                            {"instance_id": student.process_instance_id},
+                        )
+                    )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error deleting students from Postgres: {e}")
+            for student in deleted:
+                results[student.email] = {
+                    "email": student.email,
+                    "status": "failed",
+                    "detail": f"Error deleting student - {e}",
+                }
+        else:
+            outbox_worker.wake()
+            for student in deleted:
+                oauth2.principal_cache.invalidate_user(student.id)
+                results[student.email] = {
+                    "email": student.email,
+                    "status": "deleted",
+                    "job_ids": [job.id for job in jobs[student.email]],
+                }
+
+    report = [results[email] for email in emails]
+    deleted_count = sum(1 for result in report if result["status"] == "deleted")
+    logger.info(f"Deleted {deleted_count} of {len(report)} students.")
+    return {
+        "deleted": deleted_count,
+        "failed": len(report) - deleted_count,
+        "results": report,
+    }
+
+
+async def import_students(rows: List[dict], db: AsyncSession) -> dict:
+    results = {}
+    students = {}
+
+    # 1. Validate every row, and reject duplicates within the file
+    seen_emails, seen_jmbags = set(), set()
+    for row, row_data in enumerate(rows, start=1):
+        try:
+            student = schemas.StudentCreate.model_validate(row_data)
+        except ValidationError as e:
+            results[row] = {
+                "row": row,
+                "email": row_data.get("email"),
+                "status": "failed",
+                "detail": str(e),
+            }
+            continue
+        if student.email in seen_emails or student.JMBAG in seen_jmbags:
+            results[row] = {
+                "row": row,
+                "email": student.email,
+                "status": "failed",
+                "detail": "Duplicate email or JMBAG in import.",
+            }
+            continue
+        seen_emails.add(student.email)
+        seen_jmbags.add(student.JMBAG)
+        students[row] = student
+
+    # 2. Skip students that are already registered
+    if students:
+        result = await db.execute(
+            select(models.Student.email, models.Student.JMBAG).where(
+                or_(
+                    models.Student.email.in_(seen_emails),
+                    models.Student.JMBAG.in_(seen_jmbags),
+                )
+            )
+        )
+        existing = result.all()
+        existing_emails = {student.email for student in existing}
+        existing_jmbags = {student.JMBAG for student in existing}
+        for row, student in list(students.items()):
+            if student.email in existing_emails or student.JMBAG in existing_jmbags:
+                results[row] = {
+                    "row": row,
+                    "email": student.email,
+                    "status": "failed",
+                    "detail": "Student je već registriran u sustavu.",
+                }
+                del students[row]
+
+    # 3. Hash all passwords in parallel in the hashing pool
+    student_rows = {}
+    passwords = await hasher.hash_many(
+        [student.password for student in students.values()]
+    )
+    for (row, student), password in zip(students.items(), passwords):
+        student_data = student.model_dump()
+        student_data["password"] = password
+        student_rows[row] = student_data
+
+    # 4. ADD to Postgres with a single multi-row insert, together with the jobs
+    # that add the students to Baserow (run by the outbox worker)
+    if student_rows:
+        try:
+            result = await db.execute(
+                insert(models.Student).returning(
+                    models.Student.id, sort_by_parameter_order=True
+                ),
+                list(student_rows.values()),
+            )
+            ids = result.scalars().all()
+            jobs = [
+                enqueue(
+                    db,
+                    BASEROW_ADD_STUDENT,
+                    {
+                        "student_id": student_id,
+                        "data": baserow_student_payload(student_data),
+                    },
+                )
+                for student_data, student_id in zip(student_rows.values(), ids)
+            ]
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error adding imported students to Postgres: {e}")
+            for row, student_data in student_rows.items():
+                results[row] = {
+                    "row": row,
+                    "email": student_data["email"],
+                    "status": "failed",
+                    "detail": "Error adding user to Postgres",
+                }
+        else:
+            outbox_worker.wake()
+            for (row, student_data), student_id, job in zip(
+                student_rows.items(), ids, jobs
+            ):
+                results[row] = {
+                    "row": row,
+                    "email": student_data["email"],
+                    "status": "created",
+                    "id": student_id,
+                    "job_id": job.id,
+                }
+
+    report = [results[row] for row in sorted(results)]
+    created = sum(1 for result in report if result["status"] == "created")
+    logger.info(f"Imported {created} of {len(report)} students.")
+    return {"created": created, "failed": len(report) - created, "results": report}
+
+
+@router.post(
+    "/students/import",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.StudentImportReport,
+)
+async def import_students_json(
+    rows: List[dict],
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Admin = Depends(oauth2.require_admin),
+):
+    return await import_students(rows, db)
+
+
+@router.post(
+    "/students/import/csv",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.StudentImportReport,
+)
+async def import_students_csv(
+    file: UploadFile,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Admin = Depends(oauth2.require_admin),
+):
+    # Columns: ime, prezime, email, JMBAG, godina_studija, password
+    try:
+        content = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="CSV file must be UTF-8 encoded",
+        )
+    rows = list(csv.DictReader(io.StringIO(content)))
+
+    return await import_students(rows, db)
 
 
 class AvatarUpdate(BaseModel):
@@ -166,18 +506,14 @@ class AvatarUpdate(BaseModel):
 async def update_admin_avatar(
     username: str,
     avatar_update: AvatarUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.Admin = Depends(oauth2.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Admin = Depends(oauth2.require_admin),
 ):
-    if not isinstance(current_user, models.Admin):
-        logger.warning("Unauthorized access attempt to update admin avatar.")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Unauthorized",
-        )
-
     try:
-        admin = db.query(models.Admin).filter(models.Admin.username == username).first()
+        result = await db.execute(
+            select(models.Admin).where(models.Admin.username == username)
+        )
+        admin = result.scalars().first()
 
         if not admin:
             logger.warning("Admin not found.")
@@ -187,8 +523,10 @@ async def update_admin_avatar(
             )
 
         admin.avatar = avatar_update.avatar_url
-        db.commit()
-        db.refresh(admin)
+        await db.commit()
+        # The avatar is part of the cached principal served by /users/me
+        oauth2.principal_cache.invalidate_user(admin.id)
+        await db.refresh(admin)
         logger.info(f"Avatar updated successfully for admin with username {username}.")
 
     except Exception as e:
@@ -199,3 +537,27 @@ async def update_admin_avatar(
         )
 
     return {"detail": "Avatar updated successfully"}
+
+
+@router.get(
+    "/jobs/{job_id}", status_code=status.HTTP_200_OK, response_model=schemas.OutboxJob
+)
+async def get_job_status(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Admin = Depends(oauth2.require_admin),
+):
+    job = await db.get(models.OutboxJob, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+    return job
+
+
+@router.get("/cache/stats", status_code=status.HTTP_200_OK)
+async def get_cache_stats(
+    current_user: models.Admin = Depends(oauth2.require_admin),
+):
+    return {"baserow": baserow_cache.stats()}
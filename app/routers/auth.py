@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response, Request
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_db
+from app.db import get_async_db
 from app import models
 from app import schemas
-import app.utils as utils
+from app.hashing import hasher
+from app.rate_limit import login_limiter
 import app.oauth2 as oauth2
 from datetime import datetime
 import logging
@@ -17,24 +19,27 @@ logger = logging.getLogger(__name__)
 
 
 @router.post("", status_code=status.HTTP_200_OK, response_model=schemas.Token)
-def login(
+async def login(
     user_credentials: schemas.LoginForm,
     request: Request,  # <- Add this to access the request object
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = (
-        db.query(models.User)
-        .filter(models.User.email == user_credentials.email)
-        .first()
+    # Before any bcrypt work, so a flood of attempts can't eat the hashing pool
+    await login_limiter.check(request, user_credentials.email)
+
+    result = await db.execute(
+        select(models.User).where(models.User.email == user_credentials.email)
     )
+    user = result.scalars().first()
     if not user:
+        await hasher.imitate_verify()
         logger.warning(
             f"Invalid login attempt: user with email {user_credentials.email} not found."
         )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Credentials"
         )
-    if not utils.verify(user_credentials.password, user.password):
+    if not await hasher.verify(user_credentials.password, user.password):
         logger.warning(
             f"Invalid login attempt: incorrect password for user with email {user_credentials.email}."
         )
@@ -42,7 +47,11 @@ def login(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Credentials"
         )
     access_token = oauth2.create_access_token(
-        data={"user_id": user.id, "user_email": user.email},
+        data={
+            "user_id": user.id,
+            "user_email": user.email,
+            "account_type": user.account_type,
+        },
         remember_me=user_credentials.remember_me,
     )
 
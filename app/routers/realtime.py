@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException, WebSocket, status
+
+from app import oauth2
+from app.realtime import hub
+
+import logging
+
+router = APIRouter(tags=["Realtime"])
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+# Browsers can't set headers on a WebSocket handshake, so the JWT comes as ?token=
+@router.websocket("/ws")
+async def realtime_events(websocket: WebSocket, token: str = ""):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+    )
+    try:
+        token_data = oauth2.verify_access_token(token, credentials_exception)
+    except HTTPException:
+        logger.warning("Rejected realtime connection with invalid token.")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    if token_data.user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await hub.serve(websocket, token_data.user_id)
@@ -1,16 +1,14 @@
 from fastapi import status, HTTPException, Depends, APIRouter
-from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-import httpx
 import logging
 from app import models
 from app import schemas
-from app import utils
-from app.db import get_db
-from app import oauth2
+from app.hashing import hasher
+from app.db import get_async_db
 from app.routers.default_avatar import avatar
-from app.connectors.baserow_service_connector import BW_add_student_to_baserow
+from app.outbox import BASEROW_ADD_STUDENT, enqueue, outbox_worker
 
 router = APIRouter(prefix="/students", tags=["Students"])
 
@@ -18,49 +16,41 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
-# Add a new user to Postgres and Baserow
+def baserow_student_payload(student_data: dict) -> dict:
+    return {
+        "ime": student_data["ime"],
+        "prezime": student_data["prezime"],
+        "JMBAG": student_data["JMBAG"],
+        "email": student_data["email"],
+        "godina_studija": student_data["godina_studija"],
+        "avatar": avatar,
+    }
+
+
+# Add a new user to Postgres, and to Baserow through the outbox
 @router.post("", status_code=status.HTTP_201_CREATED)
-async def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
+async def create_student(
+    student: schemas.StudentCreate, db: AsyncSession = Depends(get_async_db)
+):
     student_data = student.model_dump()
 
-    student_data["password"] = utils.hash(student_data["password"])
+    student_data["password"] = await hasher.hash(student_data["password"])
     new_student = models.Student(**student_data)
 
-    new_student_baserow = {
-        "ime": new_student.ime,
-        "prezime": new_student.prezime,
-        "JMBAG": new_student.JMBAG,
-        "email": new_student.email,
-        "godina_studija": new_student.godina_studija,
-        "avatar": avatar,
-    }
-
-    # ADD to Baserow
-    try:
-        response = await BW_add_student_to_baserow(new_student_baserow)
-        new_student_baserow_id = response["data"]["id"]
-        new_student.baserow_id = new_student_baserow_id
-    except httpx.HTTPStatusError as exc:
-        error_response = exc.response.json()
-        logger.error(
-            f"Error adding user to Baserow: {error_response.get('error', 'Unknown error from Baserow')}"
-        )
-        raise HTTPException(
-            status_code=exc.response.status_code,
-            detail=error_response.get("error", "Unknown error from Baserow"),
-        )
-    except Exception as e:
-        logger.error(f"Error adding user to Baserow: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error adding user to Baserow - {e}",
-        )
-
-    # ADD to Postgres
+    # ADD to Postgres, together with the job that adds the student to Baserow
     try:
         db.add(new_student)
-        db.commit()
-        db.refresh(new_student)
+        await db.flush()
+        job = enqueue(
+            db,
+            BASEROW_ADD_STUDENT,
+            {
+                "student_id": new_student.id,
+                "data": baserow_student_payload(student_data),
+            },
+        )
+        await db.commit()
+        await db.refresh(new_student)
     except IntegrityError:
         logger.error(f"Unique constraint violated for student: {student_data}")
         raise HTTPException(
@@ -73,13 +63,16 @@ async def create_student(student: schemas.StudentCreate, db: Session = Depends(g
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error adding user to Postgres",
         )
-    del new_student.password
-    pydantic_student = schemas.Student(**new_student.__dict__)
+    outbox_worker.wake()
+
+    # schemas.Student has no password field, so it is never serialised
+    pydantic_student = schemas.Student.model_validate(new_student)
 
     return {
         "data": pydantic_student,
         "message": "Student uspješno dodan.",
         "status": 201,
+        "job_id": job.id,
     }
 
 
@@ -87,9 +80,12 @@ async def create_student(student: schemas.StudentCreate, db: Session = Depends(g
 async def update_process_instance(
     student_id: int,
     process_update: schemas.ProcessInstanceUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
+    result = await db.execute(
+        select(models.Student).where(models.Student.id == student_id)
+    )
+    student = result.scalars().first()
     if not student:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Student nije pronađen."
@@ -98,7 +94,7 @@ async def update_process_instance(
     student.process_instance_id = process_update.process_instance_id
 
     try:
-        db.commit()
+        await db.commit()
     except Exception as e:
         logger.error(f"Error updating process instance ID: {e}")
         raise HTTPException(
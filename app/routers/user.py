@@ -1,54 +1,67 @@
-from fastapi import status, HTTPException, Depends, APIRouter
+from fastapi import status, HTTPException, Depends, APIRouter, Query, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, case, func, or_, select, tuple_, update
 
 from app import models
 from app import schemas
-from app import utils
-from app.db import get_db
+from app.db import get_db, get_async_db, get_read_db
+from app.hashing import hasher
 from app import oauth2
+from app import realtime
+from app.responses import orm_response
+from app.etags import etag_matches, list_etag, make_etag, not_modified, tag
 from datetime import datetime
+from pydantic import TypeAdapter
 
 
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
+# Built once, hot routes validate and serialise their ORM rows with these
+USER_OUT = {
+    "student": TypeAdapter(schemas.Student),
+    "admin": TypeAdapter(schemas.Admin),
+}
+MESSAGE = TypeAdapter(schemas.Message)
+MESSAGES = TypeAdapter(List[schemas.Message])
+MESSAGE_PAGE = TypeAdapter(schemas.MessagePage)
+CONVERSATIONS = TypeAdapter(List[schemas.Conversation])
+
 
 @router.get("/me", status_code=status.HTTP_200_OK, response_model=schemas.UserOut)
 def get_current_user(
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(oauth2.get_current_user),
 ):
-    if current_user.account_type == "student":
-        student = (
-            db.query(models.Student)
-            .filter(models.Student.id == current_user.id)
-            .first()
-        )
-        return schemas.Student.model_validate(student.__dict__)
-    elif current_user.account_type == "admin":
-        admin = (
-            db.query(models.Admin).filter(models.Admin.id == current_user.id).first()
-        )
-        return schemas.Admin.model_validate(admin.__dict__)
-    else:
+    # The principal is already loaded as Student/Admin with all of its columns,
+    # so it is validated against its own schema instead of trying each member
+    # of the UserOut union
+    adapter = USER_OUT.get(current_user.account_type)
+    if adapter is None:
         raise HTTPException(status_code=400, detail="User account_type not recognized")
+    return orm_response(adapter, current_user)
 
 
 @router.patch("/update_password", status_code=status.HTTP_200_OK)
 async def update_password(
     password_update: schemas.PasswordUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(oauth2.get_current_user),
 ):
-    if not utils.verify(password_update.old_password, current_user.password):
+    if not await hasher.verify(password_update.old_password, current_user.password):
         return {"message": "Invalid old password. Please try again."}
 
-    current_user.password = utils.hash(password_update.new_password)
+    new_password = await hasher.hash(password_update.new_password)
 
     try:
-        db.commit()
+        await db.execute(
+            update(models.User)
+            .where(models.User.id == current_user.id)
+            .values(password=new_password)
+        )
+        await db.commit()
+        oauth2.principal_cache.invalidate_user(current_user.id)
     except Exception as e:
         print("Error updating password", e)
         raise HTTPException(
@@ -70,6 +83,31 @@ def send_message(
     if current_user.account_type != "admin" and current_user.account_type != "student":
         raise HTTPException(status_code=403, detail="Unauthorized to send messages")
 
+    # Retrieve the conversation from the database
+    conversation_db = (
+        db.query(models.Conversation)
+        .filter(models.Conversation.id == message.conversation_id)
+        .first()
+    )
+    if conversation_db is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    # Only the two participants may post, and only to each other
+    participants = (conversation_db.user_1_id, conversation_db.user_2_id)
+    if current_user.id not in participants:
+        raise HTTPException(
+            status_code=403, detail="Unauthorized to send messages to this conversation"
+        )
+    if current_user.id == conversation_db.user_1_id:
+        peer_id = conversation_db.user_2_id
+    else:
+        peer_id = conversation_db.user_1_id
+    if message.receiver_id != peer_id:
+        raise HTTPException(
+            status_code=400,
+            detail="Receiver is not the other participant of the conversation",
+        )
+
     # Create an instance of the SQLAlchemy Message class
     message_db = models.Message(
         sender_id=current_user.id,
@@ -77,29 +115,33 @@ def send_message(
         content=message.content,
     )
 
-    # Set sender_id to the current user's id
-    message_db.sender_id = current_user.id
-
-    # Save the message to the database
+    # Save the message and update the conversation in the same transaction
     db.add(message_db)
-    db.commit()
-    db.refresh(message_db)
+    db.flush()
 
-    # Retrieve the conversation from the database
-    conversation_db = (
-        db.query(models.Conversation)
-        .filter(models.Conversation.id == message.conversation_id)
-        .first()
-    )
     if conversation_db.user_1_id == current_user.id:
         conversation_db.user_1_last_message_read_id = message_db.id
     else:
         conversation_db.user_2_last_message_read_id = message_db.id
 
+    conversation_db.last_message_id = message_db.id
+    # NOW() is the transaction start time, the same value as the message timestamp
+    conversation_db.last_message_at = func.now()
     conversation_db.timestamp = datetime.now()
 
+    # Delivered to both users over the WebSocket once the transaction commits
+    db.refresh(message_db)
+    realtime.publish(
+        db,
+        "message",
+        [message_db.sender_id, message_db.receiver_id],
+        {
+            **schemas.Message.model_validate(message_db).model_dump(),
+            "conversation_id": conversation_db.id,
+        },
+    )
+
     db.commit()
-    db.refresh(conversation_db)
 
     return message_db
 
@@ -111,7 +153,7 @@ def send_message(
 )
 def get_messages(
     receiver_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(oauth2.get_current_user),
 ):
     # Check if the current user is authorized to retrieve messages
@@ -143,16 +185,22 @@ def get_messages(
     )
 
     # Combine and return both sets of messages
-    return messages_sent + messages_received
+    return orm_response(MESSAGES, messages_sent + messages_received)
+
+
+MAX_MESSAGES_PAGE_SIZE = 200
 
 
 @router.get(
-    "/get_last_message/{receiver_id}",
+    "/messages/{receiver_id}",
     status_code=status.HTTP_200_OK,
-    response_model=schemas.Message,
+    response_model=schemas.MessagePage,
 )
-def get_last_message(
+def get_messages_page(
     receiver_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=MAX_MESSAGES_PAGE_SIZE),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(oauth2.get_current_user),
 ):
@@ -160,48 +208,114 @@ def get_last_message(
     if current_user.account_type != "admin" and current_user.account_type != "student":
         raise HTTPException(status_code=403, detail="Unauthorized to retrieve messages")
 
-    # Check if the receiver_id is valid
-    if db.query(models.User).filter(models.User.id == receiver_id).first() is None:
-        raise HTTPException(status_code=404, detail="Receiver user not found")
+    if before_id is not None and after_id is not None:
+        raise HTTPException(
+            status_code=400, detail="Use either before_id or after_id, not both"
+        )
 
-    # Retrieve the most recent message where the current user is the sender and the receiver is the specified user
-    last_message_sent = (
-        db.query(models.Message)
-        .filter(
-            models.Message.sender_id == current_user.id,
-            models.Message.receiver_id == receiver_id,
+    # Messages between the two users in either direction, ordered by (timestamp, id)
+    query = db.query(models.Message).filter(
+        or_(
+            and_(
+                models.Message.sender_id == current_user.id,
+                models.Message.receiver_id == receiver_id,
+            ),
+            and_(
+                models.Message.sender_id == receiver_id,
+                models.Message.receiver_id == current_user.id,
+            ),
         )
-        .order_by(models.Message.timestamp.desc())
-        .first()
+    )
+    position = tuple_(models.Message.timestamp, models.Message.id)
+
+    if after_id is not None:
+        # Newer messages than the cursor, oldest first
+        cursor_timestamp = (
+            select(models.Message.timestamp)
+            .where(models.Message.id == after_id)
+            .scalar_subquery()
+        )
+        messages = (
+            query.filter(position > tuple_(cursor_timestamp, after_id))
+            .order_by(models.Message.timestamp.asc(), models.Message.id.asc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    else:
+        # Latest messages, or older messages than the cursor, newest first
+        if before_id is not None:
+            cursor_timestamp = (
+                select(models.Message.timestamp)
+                .where(models.Message.id == before_id)
+                .scalar_subquery()
+            )
+            query = query.filter(position < tuple_(cursor_timestamp, before_id))
+        messages = (
+            query.order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(messages) > limit
+        messages = messages[:limit][::-1]
+
+    return orm_response(
+        MESSAGE_PAGE,
+        {
+            "messages": messages,
+            "has_more": has_more,
+            "oldest_id": messages[0].id if messages else None,
+            "newest_id": messages[-1].id if messages else None,
+        },
     )
 
-    # print(last_message_sent)
 
-    # Retrieve the most recent message where the current user is the receiver and the sender is the specified user
-    last_message_received = (
+@router.get(
+    "/get_last_message/{receiver_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.Message,
+)
+def get_last_message(
+    receiver_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+):
+    # Check if the current user is authorized to retrieve messages
+    if current_user.account_type != "admin" and current_user.account_type != "student":
+        raise HTTPException(status_code=403, detail="Unauthorized to retrieve messages")
+
+    # The conversation keeps a pointer to its newest message, so this is a
+    # single indexed lookup whichever side of the conversation the user is on
+    most_recent_message = (
         db.query(models.Message)
+        .join(
+            models.Conversation,
+            models.Conversation.last_message_id == models.Message.id,
+        )
         .filter(
-            models.Message.sender_id == receiver_id,
-            models.Message.receiver_id == current_user.id,
+            or_(
+                and_(
+                    models.Conversation.user_1_id == current_user.id,
+                    models.Conversation.user_2_id == receiver_id,
+                ),
+                and_(
+                    models.Conversation.user_1_id == receiver_id,
+                    models.Conversation.user_2_id == current_user.id,
+                ),
+            )
         )
         .order_by(models.Message.timestamp.desc())
         .first()
     )
 
-    # Determine the most recent message
-    if last_message_sent and last_message_received:
-        most_recent_message = max(
-            last_message_sent, last_message_received, key=lambda x: x.timestamp
-        )
-    elif last_message_sent:
-        most_recent_message = last_message_sent
-    else:
-        most_recent_message = last_message_received
-
     if most_recent_message is None:
+        # Check if the receiver_id is valid
+        if db.query(models.User).filter(models.User.id == receiver_id).first() is None:
+            raise HTTPException(status_code=404, detail="Receiver user not found")
         raise HTTPException(status_code=200, detail="No messages found")
 
-    return most_recent_message
+    return orm_response(MESSAGE, most_recent_message)
 
 
 def get_all_students_info(current_user_id: int, db: Session) -> List[dict]:
@@ -233,9 +347,17 @@ def get_all_students_info(current_user_id: int, db: Session) -> List[dict]:
     "/get_all_users_info", status_code=status.HTTP_200_OK, response_model=List[dict]
 )
 def get_all_users_info(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(oauth2.get_current_user),
 ):
+    # The list leaves out the current user, so the tag is per user
+    etag = list_etag(db, ("user", "student"), "users_info", current_user.id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    tag(response, etag)
+
     users_info = get_all_students_info(current_user.id, db)
     return users_info
 
@@ -260,14 +382,15 @@ def get_admins_info(db: Session) -> List[dict]:
     "/get_all_admins_info", status_code=status.HTTP_200_OK, response_model=List[dict]
 )
 def get_all_admins_info(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: models.Student = Depends(oauth2.require_student),
 ):
-    # Check if the current user is an admin
-    if current_user.account_type != "student":
-        raise HTTPException(
-            status_code=403, detail="Unauthorized to access admins information"
-        )
+    etag = list_etag(db, ("user", "admin"), "admins_info")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    tag(response, etag)
 
     admins_info = get_admins_info(db)
     return admins_info
@@ -325,7 +448,8 @@ def add_conversation(
 @router.get("/get_conversations/{user_id}", response_model=List[schemas.Conversation])
 def get_conversations(
     user_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(oauth2.get_current_user),
 ):
     # Check if the current user is authorized to retrieve conversations
@@ -341,6 +465,24 @@ def get_conversations(
             detail="Unauthorized to retrieve conversations for this user",
         )
 
+    # Every change to a conversation moves its timestamp (or last_message_at),
+    # and deletions change the count, so these aggregates tag the user's list
+    count, changed_at, last_message_at = db.execute(
+        select(
+            func.count(),
+            func.max(models.Conversation.timestamp),
+            func.max(models.Conversation.last_message_at),
+        ).where(
+            or_(
+                models.Conversation.user_1_id == user_id,
+                models.Conversation.user_2_id == user_id,
+            )
+        )
+    ).one()
+    etag = make_etag("conversations", user_id, count, changed_at, last_message_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     # Retrieve conversations where the user is involved
     conversations = (
         db.query(models.Conversation)
@@ -353,7 +495,105 @@ def get_conversations(
         .all()
     )
 
-    return conversations
+    return tag(orm_response(CONVERSATIONS, conversations), etag)
+
+
+MAX_INBOX_PAGE_SIZE = 100
+
+
+@router.get(
+    "/inbox", status_code=status.HTTP_200_OK, response_model=List[schemas.InboxEntry]
+)
+def get_inbox(
+    limit: int = Query(20, ge=1, le=MAX_INBOX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+):
+    # Check if the current user is authorized to retrieve conversations
+    if current_user.account_type != "admin" and current_user.account_type != "student":
+        raise HTTPException(
+            status_code=403, detail="Unauthorized to retrieve conversations"
+        )
+
+    conversation = models.Conversation
+    peer = models.User.__table__.alias("peer")
+    peer_admin = models.Admin.__table__.alias("peer_admin")
+    last_message = models.Message.__table__.alias("last_message")
+    message = models.Message.__table__.alias("unread_message")
+
+    # The other user and the current user's read marker, from whichever side they are on
+    is_user_1 = conversation.user_1_id == current_user.id
+    peer_id = case((is_user_1, conversation.user_2_id), else_=conversation.user_1_id)
+    last_read_id = case(
+        (is_user_1, conversation.user_1_last_message_read_id),
+        else_=conversation.user_2_last_message_read_id,
+    )
+
+    unread_count = (
+        select(func.count())
+        .select_from(message)
+        .where(
+            message.c.sender_id == peer_id,
+            message.c.receiver_id == current_user.id,
+            message.c.id > func.coalesce(last_read_id, 0),
+        )
+        .scalar_subquery()
+    )
+    activity = func.coalesce(conversation.last_message_at, conversation.timestamp)
+
+    rows = db.execute(
+        select(
+            conversation,
+            peer.c.id.label("peer_id"),
+            peer.c.ime.label("peer_ime"),
+            peer.c.prezime.label("peer_prezime"),
+            peer.c.account_type.label("peer_account_type"),
+            peer_admin.c.avatar.label("peer_avatar"),
+            last_message.c.id.label("last_message_id"),
+            last_message.c.sender_id.label("last_message_sender_id"),
+            last_message.c.receiver_id.label("last_message_receiver_id"),
+            last_message.c.content.label("last_message_content"),
+            last_message.c.timestamp.label("last_message_timestamp"),
+            unread_count.label("unread_count"),
+        )
+        .join(peer, peer.c.id == peer_id)
+        .outerjoin(peer_admin, peer_admin.c.id == peer.c.id)
+        .outerjoin(last_message, last_message.c.id == conversation.last_message_id)
+        .where(
+            or_(
+                conversation.user_1_id == current_user.id,
+                conversation.user_2_id == current_user.id,
+            )
+        )
+        .order_by(activity.desc(), conversation.id.desc())
+        .limit(limit)
+        .offset(offset)
+    ).all()
+
+    return [
+        {
+            "conversation": row.Conversation,
+            "peer": {
+                "id": row.peer_id,
+                "ime": row.peer_ime,
+                "prezime": row.peer_prezime,
+                "account_type": row.peer_account_type,
+                "avatar": row.peer_avatar,
+            },
+            "last_message": {
+                "id": row.last_message_id,
+                "sender_id": row.last_message_sender_id,
+                "receiver_id": row.last_message_receiver_id,
+                "content": row.last_message_content,
+                "timestamp": row.last_message_timestamp,
+            }
+            if row.last_message_id is not None
+            else None,
+            "unread_count": row.unread_count,
+        }
+        for row in rows
+    ]
 
 
 @router.patch(
@@ -378,7 +618,9 @@ def update_conversation(
 
     # Update the conversation attributes
     if conversation_update.status is not None:
-        conversation_db.status = conversation_update.status
+        if conversation_db.status != conversation_update.status:
+            conversation_db.status = conversation_update.status
+            conversation_db.timestamp = datetime.now()
 
     if conversation_update.user_1_last_message_read_id is not None:
         if (
@@ -411,6 +653,13 @@ def update_conversation(
             conversation_db.timestamp = datetime.now()
 
     # Save the updated conversation to the database
-    db.commit()
+    db.flush()
     db.refresh(conversation_db)
+    realtime.publish(
+        db,
+        "conversation",
+        [conversation_db.user_1_id, conversation_db.user_2_id],
+        schemas.Conversation.model_validate(conversation_db).model_dump(),
+    )
+    db.commit()
     return conversation_db
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, ValidationError
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from typing import Union
 
@@ -14,6 +14,8 @@ class Conversation(BaseModel):
     user_1_active: bool
     user_2_active: bool
     timestamp: datetime
+    last_message_id: Union[int, None] = None
+    last_message_at: Union[datetime, None] = None
 
     class Config:
         from_attributes = True
@@ -48,6 +50,28 @@ class Message(BaseModel):
         from_attributes = True
 
 
+class MessagePage(BaseModel):
+    messages: List[Message]
+    has_more: bool
+    oldest_id: Optional[int] = None
+    newest_id: Optional[int] = None
+
+
+class InboxPeer(BaseModel):
+    id: int
+    ime: str
+    prezime: str
+    account_type: str
+    avatar: Optional[str] = None
+
+
+class InboxEntry(BaseModel):
+    conversation: Conversation
+    peer: InboxPeer
+    last_message: Optional[Message] = None
+    unread_count: int
+
+
 class MessageCreate(BaseModel):
     conversation_id: int
     receiver_id: int
@@ -89,7 +113,7 @@ class Student(User):
     JMBAG: str
     godina_studija: str
     process_instance_id: Optional[str] = None
-    baserow_id: int
+    baserow_id: Optional[int] = None
 
 
 try:
@@ -98,6 +122,56 @@ except ValidationError as exc:
     print(repr(exc.errors()[0]["type"]))
 
 
+class StudentImportResult(BaseModel):
+    row: int
+    email: Optional[str] = None
+    status: str
+    id: Optional[int] = None
+    # Outbox job adding the student to Baserow
+    job_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class StudentImportReport(BaseModel):
+    created: int
+    failed: int
+    results: List[StudentImportResult]
+
+
+class StudentBulkDelete(BaseModel):
+    emails: List[str]
+
+
+class StudentBulkDeleteResult(BaseModel):
+    email: str
+    status: str
+    detail: Optional[str] = None
+    # Outbox jobs deleting the student from Baserow and the BPMN Engine
+    job_ids: Optional[List[int]] = None
+
+
+class StudentBulkDeleteReport(BaseModel):
+    deleted: int
+    failed: int
+    results: List[StudentBulkDeleteResult]
+
+
+class OutboxJob(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    next_attempt_at: datetime
+    last_error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class ProcessInstanceUpdate(BaseModel):
     process_instance_id: str
 
@@ -139,6 +213,8 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     user_id: Optional[int] = None
     user_email: Optional[EmailStr] = None
+    account_type: Optional[str] = None
+    expires_at: Optional[datetime] = None
 
 
 UserOut = Union[Student, Admin]
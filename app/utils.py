@@ -1,3 +1,5 @@
+from typing import List
+
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -9,3 +11,7 @@ def hash(password: str):
 
 def verify(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def hash_many(passwords: List[str]) -> List[str]:
+    return [hash(password) for password in passwords]
@@ -0,0 +1,296 @@
+"""
+Benchmarks the hot endpoints in-process: the app is driven through
+httpx.ASGITransport, and Baserow and the BPMN engine are replaced by the stubs
+in benchmarks.stubs. The database is the one from the app settings, seeded
+with benchmarks.seed.
+
+Reports throughput and p50/p95/p99 latency per endpoint and writes them as
+JSON, so runs can be compared with --compare.
+
+Run with:
+    python -m benchmarks.seed --size medium --reset
+    python -m benchmarks.run --size medium --output results.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from itertools import count
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from app import rate_limit
+from app.connectors import http_clients
+from benchmarks import seed, stubs
+
+BASE_URL = "http://benchmark"
+
+Request = Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    request: Request
+    requests: int
+
+
+def percentile(values: List[float], p: float) -> float:
+    # Nearest-rank percentile of sorted values
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+async def measure(
+    client: httpx.AsyncClient, scenario: Scenario, concurrency: int, warmup: int
+) -> dict:
+    for _ in range(warmup):
+        await scenario.request(client)
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = iter(range(scenario.requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await scenario.request(client)
+                status = str(response.status_code)
+            except Exception as e:
+                status = e.__class__.__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(n for status, n in statuses.items() if status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def login(client: httpx.AsyncClient, email: str) -> dict:
+    response = await client.post(
+        "/auth", json={"email": email, "password": seed.PASSWORD}
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def peer_of(client: httpx.AsyncClient, user_id: int, headers: dict) -> int:
+    response = await client.get(f"/users/get_conversations/{user_id}", headers=headers)
+    response.raise_for_status()
+    conversation = response.json()[0]
+    if conversation["user_1_id"] == user_id:
+        return conversation["user_2_id"]
+    return conversation["user_1_id"]
+
+
+def build_scenarios(
+    student_headers: dict, admin_headers: dict, peer_id: int, requests: int
+) -> List[Scenario]:
+    new_students = count(1)
+
+    def create_student(client: httpx.AsyncClient):
+        n = next(new_students)
+        stamp = int(time.time() * 1000) % 10**8
+        return client.post(
+            "/students",
+            json={
+                "ime": "Bench",
+                "prezime": "New",
+                "email": f"bench.new{stamp}.{n}@example.com",
+                "password": seed.PASSWORD,
+                "JMBAG": f"8{stamp:08d}{n:05d}",
+                "godina_studija": "3",
+            },
+        )
+
+    return [
+        Scenario(
+            "POST /auth",
+            lambda client: client.post(
+                "/auth",
+                json={"email": seed.student_email(1), "password": seed.PASSWORD},
+            ),
+            requests,
+        ),
+        Scenario(
+            "GET /users/me",
+            lambda client: client.get("/users/me", headers=student_headers),
+            requests,
+        ),
+        Scenario(
+            "GET /users/get_messages/{receiver_id}",
+            lambda client: client.get(
+                f"/users/get_messages/{peer_id}", headers=student_headers
+            ),
+            requests,
+        ),
+        Scenario(
+            "GET /admin/students",
+            lambda client: client.get("/admin/students", headers=admin_headers),
+            requests,
+        ),
+        Scenario("POST /students", create_student, requests),
+    ]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run(args) -> dict:
+    from app.main import app
+
+    if not args.rate_limit:
+        # Every POST /auth comes from the same client and email
+        rate_limit.login_limiter.backend = None
+
+    baserow_config = stubs.StubConfig(
+        args.baserow_latency, args.baserow_jitter, args.baserow_failure_rate
+    )
+    bpmn_config = stubs.StubConfig(
+        args.bpmn_latency, args.bpmn_jitter, args.bpmn_failure_rate
+    )
+    size = seed.SIZES[args.size]
+    upstreams = {
+        http_clients.BASEROW: stubs.baserow_app(baserow_config, rows=size.students),
+        http_clients.BPMN_ENGINE: stubs.bpmn_engine_app(bpmn_config),
+    }
+    stub_clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=stub))
+        for name, stub in upstreams.items()
+    }
+    for name, stub_client in stub_clients.items():
+        http_clients.set_client(name, stub_client)
+
+    results = {}
+    try:
+        # ASGITransport doesn't send lifespan events, so run the lifespan here
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url=BASE_URL
+            ) as client:
+                student_headers = await login(client, seed.student_email(1))
+                admin_headers = await login(client, seed.admin_email(1))
+                me = (await client.get("/users/me", headers=student_headers)).json()
+                peer_id = await peer_of(client, me["id"], student_headers)
+
+                for scenario in build_scenarios(
+                    student_headers, admin_headers, peer_id, args.requests
+                ):
+                    if args.only and scenario.name not in args.only:
+                        continue
+                    results[scenario.name] = await measure(
+                        client, scenario, args.concurrency, args.warmup
+                    )
+                    print(f"{scenario.name}: {results[scenario.name]}")
+    finally:
+        for name, stub_client in stub_clients.items():
+            http_clients.set_client(name, None)
+            await stub_client.aclose()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "size": args.size,
+            "seed": asdict(size),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "rate_limit": args.rate_limit,
+            "baserow_stub": asdict(baserow_config),
+            "bpmn_stub": asdict(bpmn_config),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict):
+    print(
+        f"\n{'endpoint':<40} {'metric':<15} "
+        f"{'baseline':>10} {'current':>10} {'change':>8}"
+    )
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = before[metric], result[metric]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{name:<40} {metric:<15} {old:>10} {new:>10} {change:>8}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--size",
+        choices=seed.SIZES,
+        default="small",
+        help="size the database was seeded with (sizes the Baserow stub)",
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument(
+        "--only", action="append", help="scenario name to run, may be repeated"
+    )
+    parser.add_argument("--baserow-latency", type=float, default=0.02)
+    parser.add_argument("--baserow-jitter", type=float, default=0.01)
+    parser.add_argument("--baserow-failure-rate", type=float, default=0.0)
+    parser.add_argument("--bpmn-latency", type=float, default=0.02)
+    parser.add_argument("--bpmn-jitter", type=float, default=0.01)
+    parser.add_argument("--bpmn-failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rate-limit",
+        action="store_true",
+        help="keep the login rate limiter on (POST /auth will mostly get 429)",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Seeds the configured Postgres database with synthetic admins, students,
+conversations and messages for the benchmarks. The schema must already be
+migrated (`alembic upgrade head`).
+
+All seeded users have an `@example.com` email starting with `bench.` and the
+password `benchmark`; `--reset` removes them (and their chat data) first.
+
+Run with: python -m benchmarks.seed --size small --reset
+"""
+import argparse
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import List
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+
+from app import models, utils
+from app.db import SessionLocal
+
+PASSWORD = "benchmark"
+EMAIL_PATTERN = "bench.%@example.com"
+
+
+@dataclass
+class Size:
+    admins: int
+    students: int
+    # Every student talks to one admin, round robin
+    messages_per_conversation: int
+
+
+SIZES = {
+    "small": Size(admins=2, students=50, messages_per_conversation=20),
+    "medium": Size(admins=10, students=1000, messages_per_conversation=100),
+    "large": Size(admins=20, students=10000, messages_per_conversation=200),
+}
+
+BATCH_SIZE = 5000
+
+
+def admin_email(i: int) -> str:
+    return f"bench.admin{i}@example.com"
+
+
+def student_email(i: int) -> str:
+    return f"bench.student{i}@example.com"
+
+
+def reset(db):
+    user_ids = select(models.User.id).where(models.User.email.like(EMAIL_PATTERN))
+    db.execute(
+        delete(models.Conversation).where(
+            or_(
+                models.Conversation.user_1_id.in_(user_ids),
+                models.Conversation.user_2_id.in_(user_ids),
+            )
+        )
+    )
+    db.execute(
+        delete(models.Message).where(
+            or_(
+                models.Message.sender_id.in_(user_ids),
+                models.Message.receiver_id.in_(user_ids),
+            )
+        )
+    )
+    db.execute(delete(models.Student.__table__).where(models.Student.id.in_(user_ids)))
+    db.execute(delete(models.Admin.__table__).where(models.Admin.id.in_(user_ids)))
+    db.execute(delete(models.User).where(models.User.email.like(EMAIL_PATTERN)))
+
+
+def insert_batched(db, statement, rows: List[dict]) -> list:
+    ids = []
+    for i in range(0, len(rows), BATCH_SIZE):
+        result = db.execute(statement, rows[i : i + BATCH_SIZE])
+        ids.extend(result.scalars().all())
+    return ids
+
+
+def seed(db, size: Size):
+    # One hash for everybody, bcrypt would dominate the seeding time otherwise
+    password = utils.hash(PASSWORD)
+
+    admin_ids = insert_batched(
+        db,
+        insert(models.Admin).returning(models.Admin.id, sort_by_parameter_order=True),
+        [
+            {
+                "ime": f"Bench{i}",
+                "prezime": "Admin",
+                "email": admin_email(i),
+                "password": password,
+                "username": f"bench.admin{i}",
+            }
+            for i in range(1, size.admins + 1)
+        ],
+    )
+    student_ids = insert_batched(
+        db,
+        insert(models.Student).returning(
+            models.Student.id, sort_by_parameter_order=True
+        ),
+        [
+            {
+                "ime": f"Bench{i}",
+                "prezime": "Student",
+                "email": student_email(i),
+                "password": password,
+                # Matches the rows listed by the Baserow stub
+                "baserow_id": i,
+                "JMBAG": f"9{i:09d}",
+                "godina_studija": "3",
+            }
+            for i in range(1, size.students + 1)
+        ],
+    )
+
+    conversation_ids = insert_batched(
+        db,
+        insert(models.Conversation).returning(
+            models.Conversation.id, sort_by_parameter_order=True
+        ),
+        [
+            {
+                "user_1_id": student_id,
+                "user_2_id": admin_ids[i % len(admin_ids)],
+                "status": "active",
+                "user_1_active": True,
+                "user_2_active": True,
+            }
+            for i, student_id in enumerate(student_ids)
+        ],
+    )
+
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+
+    def message_rows():
+        for i, student_id in enumerate(student_ids):
+            admin_id = admin_ids[i % len(admin_ids)]
+            for m in range(size.messages_per_conversation):
+                yield {
+                    "sender_id": student_id if m % 2 == 0 else admin_id,
+                    "receiver_id": admin_id if m % 2 == 0 else student_id,
+                    "content": f"Benchmark message {m}",
+                    "timestamp": start + timedelta(minutes=m),
+                }
+
+    rows = message_rows()
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        db.execute(insert(models.Message), batch)
+
+    # Point every conversation at its newest message, as send_message does
+    conversation = models.Conversation
+    last_message_id = (
+        select(func.max(models.Message.id))
+        .where(
+            or_(
+                and_(
+                    models.Message.sender_id == conversation.user_1_id,
+                    models.Message.receiver_id == conversation.user_2_id,
+                ),
+                and_(
+                    models.Message.sender_id == conversation.user_2_id,
+                    models.Message.receiver_id == conversation.user_1_id,
+                ),
+            )
+        )
+        .scalar_subquery()
+    )
+    seeded = conversation.id.in_(conversation_ids)
+    db.execute(
+        update(conversation)
+        .where(seeded)
+        .values(
+            last_message_id=last_message_id,
+            user_1_last_message_read_id=last_message_id,
+        )
+    )
+    db.execute(
+        update(conversation)
+        .where(seeded)
+        .values(
+            last_message_at=select(models.Message.timestamp)
+            .where(models.Message.id == conversation.last_message_id)
+            .scalar_subquery()
+        )
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=SIZES, default="small")
+    parser.add_argument(
+        "--reset", action="store_true", help="remove previously seeded data first"
+    )
+    args = parser.parse_args()
+    size = SIZES[args.size]
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        if args.reset:
+            reset(db)
+        seed(db, size)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    print(
+        f"Seeded {args.size} {asdict(size)} in {time.perf_counter() - started:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
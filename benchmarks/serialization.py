@@ -0,0 +1,171 @@
+"""
+Microbenchmark of the CPU cost per response of serialising ORM rows:
+
+- before: FastAPI's response_model path (validate, dump to Python, encode)
+  rendered by JSONResponse, with /users/me building its schema from
+  `__dict__` first, as the routes used to
+- orjson default: the same response_model path rendered by ORJSONResponse
+- orm_response: a single from_attributes validation, serialised to JSON
+  bytes by pydantic-core (app.responses.orm_response)
+
+No database is needed, the rows are transient ORM objects.
+
+Run with: python -m benchmarks.serialization [--output serialization.json]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import models, schemas
+from app.responses import orm_response
+from app.routers.user import CONVERSATIONS, MESSAGES, USER_OUT
+
+
+def make_student() -> models.Student:
+    return models.Student(
+        id=1,
+        ime="Bench",
+        prezime="Student",
+        email="bench.student1@example.com",
+        password="$2b$12$" + "x" * 53,
+        account_type="student",
+        created_at=datetime.now(timezone.utc),
+        baserow_id=1,
+        JMBAG="9000000001",
+        godina_studija="3",
+        process_instance_id=None,
+    )
+
+
+def make_messages(n: int) -> List[models.Message]:
+    start = datetime.now(timezone.utc)
+    return [
+        models.Message(
+            id=i,
+            sender_id=1 if i % 2 else 2,
+            receiver_id=2 if i % 2 else 1,
+            content=f"Benchmark message {i} " * 4,
+            timestamp=start + timedelta(seconds=i),
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def make_conversations(n: int) -> List[models.Conversation]:
+    now = datetime.now(timezone.utc)
+    return [
+        models.Conversation(
+            id=i,
+            user_1_id=1,
+            user_2_id=i + 1,
+            status="active",
+            user_1_last_message_read_id=i,
+            user_2_last_message_read_id=None,
+            user_1_active=True,
+            user_2_active=False,
+            timestamp=now,
+            last_message_id=i,
+            last_message_at=now,
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def fastapi_path(response_model, response_class) -> Callable:
+    field = create_response_field(name="Response", type_=response_model)
+
+    async def render(data):
+        content = await serialize_response(field=field, response_content=data)
+        return response_class(content).body
+
+    return render
+
+
+def per_response_us(render: Callable, data, iterations: int) -> float:
+    async def loop():
+        for _ in range(iterations):
+            result = render(data)
+            if asyncio.iscoroutine(result):
+                await result
+
+    start = time.process_time()
+    asyncio.run(loop())
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def cases():
+    student = make_student()
+
+    async def me_before(user):
+        # The old /users/me: a Student schema built from __dict__, re-validated
+        # against UserOut by FastAPI
+        data = schemas.Student.model_validate(user.__dict__)
+        return await me_fastapi(data)
+
+    me_fastapi = fastapi_path(schemas.UserOut, JSONResponse)
+
+    def me_after(user):
+        return orm_response(USER_OUT[user.account_type], user).body
+
+    yield "GET /users/me", student, {
+        "before": me_before,
+        "orjson default": fastapi_path(schemas.UserOut, ORJSONResponse),
+        "orm_response": me_after,
+    }
+
+    for n in (50, 500):
+        yield f"GET /users/get_messages ({n} messages)", make_messages(n), {
+            "before": fastapi_path(List[schemas.Message], JSONResponse),
+            "orjson default": fastapi_path(List[schemas.Message], ORJSONResponse),
+            "orm_response": lambda data: orm_response(MESSAGES, data).body,
+        }
+
+    yield "GET /users/get_conversations (20)", make_conversations(20), {
+        "before": fastapi_path(List[schemas.Conversation], JSONResponse),
+        "orjson default": fastapi_path(List[schemas.Conversation], ORJSONResponse),
+        "orm_response": lambda data: orm_response(CONVERSATIONS, data).body,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, data, variants in cases():
+        results[name] = {}
+        for variant, render in variants.items():
+            # Big pages are far slower than single rows, scale the iterations
+            rows = len(data) if isinstance(data, list) else 1
+            iterations = max(50, args.iterations // max(1, rows // 50))
+            results[name][variant] = round(
+                per_response_us(render, data, iterations), 1
+            )
+        before = results[name]["before"]
+        summary = ", ".join(
+            f"{variant} {us:.1f} µs ({before / us:.1f}x)"
+            for variant, us in results[name].items()
+        )
+        print(f"{name}: {summary}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"unit": "cpu_us_per_response", "results": results}, f, indent=2
+            )
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
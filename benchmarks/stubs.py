@@ -0,0 +1,111 @@
+"""
+Stand-ins for the Baserow and BPMN engine connectors, with configurable
+latency and failure rate. The benchmark harness mounts them in-process with
+httpx.ASGITransport; they can also be served on their own to benchmark a
+running deployment:
+
+    uvicorn --factory benchmarks.stubs:baserow_app_from_env --port 9101
+"""
+import asyncio
+import os
+import random
+from dataclasses import dataclass
+from itertools import count
+
+from fastapi import FastAPI, Response, status
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.0  # seconds
+    jitter: float = 0.0  # seconds, added uniformly on top of `latency`
+    failure_rate: float = 0.0  # share of requests answered with a 503
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "StubConfig":
+        return cls(
+            latency=float(os.environ.get(f"{prefix}_LATENCY", 0)),
+            jitter=float(os.environ.get(f"{prefix}_JITTER", 0)),
+            failure_rate=float(os.environ.get(f"{prefix}_FAILURE_RATE", 0)),
+        )
+
+
+async def simulate(config: StubConfig):
+    delay = config.latency + random.uniform(0, config.jitter)
+    if delay:
+        await asyncio.sleep(delay)
+    return random.random() < config.failure_rate
+
+
+def unavailable() -> Response:
+    return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def student_row(baserow_id: int) -> dict:
+    return {
+        "id": baserow_id,
+        "ime": f"Bench{baserow_id}",
+        "prezime": "Student",
+        "JMBAG": f"9{baserow_id:09d}",
+        "email": f"bench.student{baserow_id}@example.com",
+        "godina_studija": "3",
+    }
+
+
+def baserow_app(config: StubConfig, rows: int) -> FastAPI:
+    """
+    `rows` students are listed, with Baserow ids 1..rows, which matches the
+    `baserow_id`s written by benchmarks.seed.
+    """
+    app = FastAPI()
+    next_id = count(rows + 1)
+
+    @app.get("/api/{table_name}")
+    async def list_rows(table_name: str, page: int = 1, size: int = 100):
+        if await simulate(config):
+            return unavailable()
+        start = (page - 1) * size + 1
+        end = min(rows, start + size - 1)
+        return {
+            "data": {
+                "count": rows,
+                "results": [student_row(i) for i in range(start, end + 1)],
+            }
+        }
+
+    @app.post("/api/student")
+    async def add_student(data: dict):
+        if await simulate(config):
+            return unavailable()
+        return {"data": {**data, "id": next(next_id)}}
+
+    @app.delete("/api/student/email/{email}")
+    async def delete_student(email: str):
+        if await simulate(config):
+            return unavailable()
+        return {"status": True}
+
+    return app
+
+
+def bpmn_engine_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.delete("/instance/{instance_id}")
+    async def remove_instance(instance_id: str):
+        if await simulate(config):
+            return unavailable()
+        return {"id": instance_id, "removed": True}
+
+    return app
+
+
+def baserow_app_from_env() -> FastAPI:
+    return baserow_app(
+        StubConfig.from_env("STUB_BASEROW"),
+        rows=int(os.environ.get("STUB_BASEROW_ROWS", 100)),
+    )
+
+
+def bpmn_engine_app_from_env() -> FastAPI:
+    return bpmn_engine_app(StubConfig.from_env("STUB_BPMN"))
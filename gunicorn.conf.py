@@ -0,0 +1,48 @@
+# Production server: a gunicorn master pre-forking uvicorn workers.
+# Run with: gunicorn -c gunicorn.conf.py app.main:app
+#
+# Every worker has its own event loop, SQLAlchemy pools (DB_POOL_SIZE +
+# DB_MAX_OVERFLOW for each engine) and bcrypt process pool, so size Postgres'
+# max_connections (or PgBouncer's) for workers * 2 * (pool size + overflow).
+import multiprocessing
+import os
+import shutil
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8081')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", cpu_count))
+
+# Split the cores between the workers' bcrypt pools instead of every worker
+# starting one hashing process per core
+os.environ.setdefault("HASH_POOL_WORKERS", str(max(1, cpu_count // workers)))
+
+# On SIGTERM workers stop accepting connections, /ready turns 503, in-flight
+# requests get `graceful_timeout` seconds to finish and the lifespan shutdown
+# closes the pools
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+
+# Recycle workers now and then, staggered so they don't all restart at once
+max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Samples of a previous run would be summed into /metrics otherwise
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
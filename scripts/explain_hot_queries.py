@@ -0,0 +1,119 @@
+"""
+Runs EXPLAIN on the hot chat queries from app/routers/user.py and checks that
+each one is served by the expected index. Exits with status 1 otherwise.
+
+Sequential scans are disabled for the check, so it verifies that the planner
+*can* use the index for the query shape, even on small development tables
+where a sequential scan would be cheaper.
+
+Run with: python -m scripts.explain_hot_queries
+"""
+import json
+import sys
+
+from sqlalchemy import and_, or_, select, text, tuple_
+
+from app import models
+from app.db import SessionLocal
+
+USER_ID = 1
+PEER_ID = 2
+
+MESSAGE_PAIR_INDEX = "ix_message_sender_id_receiver_id_timestamp"
+CONVERSATION_INDEXES = {
+    "ix_conversation_user_1_id_user_2_id",
+    "ix_conversation_user_2_id_user_1_id",
+}
+
+
+def message_pair(sender_id: int, receiver_id: int):
+    return and_(
+        models.Message.sender_id == sender_id,
+        models.Message.receiver_id == receiver_id,
+    )
+
+
+HOT_QUERIES = {
+    "get_messages (one direction)": (
+        select(models.Message).where(message_pair(USER_ID, PEER_ID)),
+        {MESSAGE_PAIR_INDEX},
+    ),
+    "get_messages_page (both directions, keyset)": (
+        select(models.Message)
+        .where(
+            or_(message_pair(USER_ID, PEER_ID), message_pair(PEER_ID, USER_ID)),
+            tuple_(models.Message.timestamp, models.Message.id)
+            < tuple_(
+                select(models.Message.timestamp)
+                .where(models.Message.id == 1000)
+                .scalar_subquery(),
+                1000,
+            ),
+        )
+        .order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+        .limit(51),
+        {MESSAGE_PAIR_INDEX},
+    ),
+    "get_last_message (one direction)": (
+        select(models.Message)
+        .where(message_pair(USER_ID, PEER_ID))
+        .order_by(models.Message.timestamp.desc())
+        .limit(1),
+        {MESSAGE_PAIR_INDEX},
+    ),
+    "get_conversations": (
+        select(models.Conversation).where(
+            or_(
+                models.Conversation.user_1_id == USER_ID,
+                models.Conversation.user_2_id == USER_ID,
+            )
+        ),
+        CONVERSATION_INDEXES,
+    ),
+    "add_conversation (existing pair lookup)": (
+        select(models.Conversation).where(
+            models.Conversation.user_1_id == USER_ID,
+            models.Conversation.user_2_id == PEER_ID,
+        ),
+        CONVERSATION_INDEXES,
+    ),
+}
+
+
+def used_indexes(plan: dict) -> set:
+    indexes = set()
+    if "Index Name" in plan:
+        indexes.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        indexes |= used_indexes(child)
+    return indexes
+
+
+def main() -> int:
+    failures = 0
+    db = SessionLocal()
+    try:
+        db.execute(text("SET enable_seqscan = off"))
+        for name, (query, expected) in HOT_QUERIES.items():
+            compiled = query.compile(
+                bind=db.get_bind(), compile_kwargs={"literal_binds": True}
+            )
+            row = db.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+            plan = (row if isinstance(row, list) else json.loads(row))[0]["Plan"]
+            indexes = used_indexes(plan)
+
+            if indexes & expected:
+                print(f"OK    {name}: {', '.join(sorted(indexes))}")
+            else:
+                failures += 1
+                print(f"FAIL  {name}: expected one of {sorted(expected)}")
+                print(json.dumps(plan, indent=2))
+    finally:
+        db.rollback()
+        db.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+# The settings are read when app.config is imported, so they are filled in
+# before any test module imports the app. Variables already set win.
+TEST_POSTGRES_DB_NAME = os.environ.get("TEST_POSTGRES_DB_NAME")
+
+DEFAULTS = {
+    "POSTGRES_HOSTNAME": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_PASSWORD": "postgres",
+    "POSTGRES_USERNAME": "postgres",
+    "POSTGRES_DB_NAME": "test",
+    "SECRET_KEY": "test",
+    "PASS_HASHING_ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "REMEMBER_ME_EXPIRE_MINUTES": "60",
+    "BUGSNAG": "test",
+    "BASEROW_CONNECTOR_URL": "http://baserow",
+    "BPMN_ENGINE_URL": "http://bpmn-engine",
+    # Failures are counted by the tests themselves, not retried or tripped on
+    "UPSTREAM_RETRIES": "0",
+    "UPSTREAM_BREAKER_FAILURE_THRESHOLD": "1000",
+}
+for name, value in DEFAULTS.items():
+    os.environ.setdefault(name, value)
+
+# Tests that need Postgres create and drop their tables, so they only run
+# against a database set aside for them
+if TEST_POSTGRES_DB_NAME:
+    os.environ["POSTGRES_DB_NAME"] = TEST_POSTGRES_DB_NAME
+
+
+class FakeClock:
+    """Stands in for a module's `time`, moved forward by hand with advance()."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return time.perf_counter()
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Returns a function that replaces `time` in the given modules with one FakeClock."""
+    fake = FakeClock()
+
+    def freeze(*modules) -> FakeClock:
+        for module in modules:
+            monkeypatch.setattr(module, "time", fake)
+        return fake
+
+    return freeze
+
+
+@pytest.fixture
+def database():
+    """Creates the tables in the TEST_POSTGRES_DB_NAME database and drops them after."""
+    if not TEST_POSTGRES_DB_NAME:
+        pytest.skip("set TEST_POSTGRES_DB_NAME to a scratch Postgres database")
+
+    from app import models
+    from app.db import get_engine
+
+    engine = get_engine()
+    models.Base.metadata.create_all(engine)
+    yield engine
+    models.Base.metadata.drop_all(engine)
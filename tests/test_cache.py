@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from app.connectors import cache
+from app.connectors.cache import TTLCache
+
+
+class Loader:
+    """Returns "v1", "v2", ... and can be told to fail or to wait for release()."""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self.gate = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return f"v{self.calls}"
+
+
+async def settle():
+    """Lets the background loads and their done callbacks run."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def make_cache(**options) -> TTLCache:
+    return TTLCache(**{"default_ttl": 10, **options})
+
+
+def test_fresh_entries_are_served_from_cache(clock):
+    fake = clock(cache)
+    ttl_cache = make_cache(ttls={"Slow": 100})
+    loader = Loader()
+
+    async def scenario():
+        assert await ttl_cache.get("Student", None, loader) == "v1"
+        fake.advance(9.9)
+        assert await ttl_cache.get("Student", None, loader) == "v1"
+        fake.advance(0.1)
+        assert await ttl_cache.get("Student", None, loader) == "v2"
+        # Per namespace TTL
+        assert await ttl_cache.get("Slow", None, loader) == "v3"
+        fake.advance(50)
+        assert await ttl_cache.get("Slow", None, loader) == "v3"
+
+    asyncio.run(scenario())
+    assert ttl_cache.stats()["hits"] == 2
+
+
+def test_concurrent_misses_share_one_load():
+    ttl_cache = make_cache()
+    loader = Loader()
+
+    async def scenario():
+        loader.gate = asyncio.Event()
+        waiters = [
+            asyncio.ensure_future(ttl_cache.get("Student", None, loader))
+            for _ in range(5)
+        ]
+        await settle()
+        loader.gate.set()
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(scenario()) == ["v1"] * 5
+    assert loader.calls == 1
+    assert ttl_cache.stats()["coalesced"] == 4
+
+
+def test_stale_entries_are_served_while_refreshing(clock):
+    fake = clock(cache)
+    ttl_cache = make_cache(stale_ttl=60)
+    loader = Loader()
+
+    async def scenario():
+        await ttl_cache.get("Student", None, loader)
+        fake.advance(30)
+        # Served at once, the refresh runs in the background
+        assert await ttl_cache.get("Student", None, loader) == "v1"
+        await settle()
+        assert await ttl_cache.get("Student", None, loader) == "v2"
+
+        # Past the stale window the caller waits for the load
+        fake.advance(100)
+        assert await ttl_cache.get("Student", None, loader) == "v3"
+
+    asyncio.run(scenario())
+    assert ttl_cache.stats()["stale_hits"] == 1
+
+
+def test_failed_load_serves_stale_data_within_stale_if_error(clock):
+    fake = clock(cache)
+    ttl_cache = make_cache(stale_if_error=100)
+    loader = Loader()
+
+    async def scenario():
+        await ttl_cache.get("Student", None, loader)
+        loader.fail = True
+        fake.advance(50)
+        assert await ttl_cache.get("Student", None, loader) == "v1"
+        fake.advance(50)
+        with pytest.raises(RuntimeError):
+            await ttl_cache.get("Student", None, loader)
+
+    asyncio.run(scenario())
+    assert ttl_cache.stats()["stale_on_error"] == 1
+
+
+def test_invalidated_entries_are_reloaded_but_kept_for_errors(clock):
+    clock(cache)
+    ttl_cache = make_cache(stale_ttl=60, stale_if_error=100)
+    loader = Loader()
+
+    async def scenario():
+        await ttl_cache.get("Student", None, loader)
+        ttl_cache.invalidate("Student")
+        # Still fresh, but invalidated: reloaded before being served
+        assert await ttl_cache.get("Student", None, loader) == "v2"
+
+        ttl_cache.invalidate("Student")
+        loader.fail = True
+        assert await ttl_cache.get("Student", None, loader) == "v2"
+
+    asyncio.run(scenario())
+
+
+def test_load_started_before_an_invalidation_is_not_stored():
+    ttl_cache = make_cache()
+    loader = Loader()
+
+    async def scenario():
+        loader.gate = asyncio.Event()
+        first = asyncio.ensure_future(ttl_cache.get("Student", None, loader))
+        await settle()
+        ttl_cache.invalidate("Student")
+        loader.gate.set()
+        assert await first == "v1"
+        assert await ttl_cache.get("Student", None, loader) == "v2"
+
+    asyncio.run(scenario())
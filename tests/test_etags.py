@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+from app.etags import etag_matches, make_etag, not_modified
+
+ETAG = make_etag("users", 1, 2)
+
+
+def request_with(if_none_match=None):
+    headers = {} if if_none_match is None else {"if-none-match": if_none_match}
+    return SimpleNamespace(headers=headers)
+
+
+def test_make_etag_depends_on_every_part():
+    assert ETAG == make_etag("users", 1, 2)
+    assert ETAG.startswith('W/"') and len(ETAG) == 36
+    assert make_etag("users", 1, 3) != ETAG
+    assert make_etag("admins", 1, 2) != ETAG
+
+
+def test_etag_matches():
+    assert etag_matches(request_with(ETAG), ETAG)
+    # Weak comparison: the W/ prefix is ignored on either side
+    assert etag_matches(request_with(ETAG.removeprefix("W/")), ETAG)
+    assert etag_matches(request_with(f'W/"other", {ETAG}'), ETAG)
+    assert etag_matches(request_with("*"), ETAG)
+
+    assert not etag_matches(request_with(), ETAG)
+    assert not etag_matches(request_with(""), ETAG)
+    assert not etag_matches(request_with(make_etag("users", 1, 3)), ETAG)
+
+
+def test_not_modified_is_an_empty_tagged_304():
+    response = not_modified(ETAG)
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == ETAG
+    assert response.headers["cache-control"] == "private, no-cache"
@@ -0,0 +1,101 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app import models
+from app.routers.user import get_messages_page
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def add_student(db: Session, number: int) -> models.Student:
+    student = models.Student(
+        ime="Chat",
+        prezime="Student",
+        email=f"chat{number}@example.com",
+        password="x",
+        JMBAG=f"{number:010}",
+    )
+    db.add(student)
+    db.flush()
+    return student
+
+
+@pytest.fixture
+def chat(database):
+    """
+    Two students and their messages, inserted out of timestamp order and with
+    two equal timestamps. Returns the session, both students and the message
+    ids in (timestamp, id) order.
+    """
+    with Session(bind=database, expire_on_commit=False) as db:
+        ana, ivo = add_student(db, 1), add_student(db, 2)
+        other = add_student(db, 3)
+
+        minutes = [0, 2, 1, 1, 3]
+        messages = [
+            models.Message(
+                sender_id=(ana.id, ivo.id)[i % 2],
+                receiver_id=(ivo.id, ana.id)[i % 2],
+                content=f"message {i}",
+                timestamp=START + timedelta(minutes=minute),
+            )
+            for i, minute in enumerate(minutes)
+        ]
+        # Not part of the conversation
+        messages.append(
+            models.Message(
+                sender_id=ana.id, receiver_id=other.id, content="other", timestamp=START
+            )
+        )
+        db.add_all(messages)
+        db.commit()
+
+        ordered = [messages[i].id for i in (0, 2, 3, 1, 4)]
+        yield db, ana, ivo, ordered
+
+
+def page(db, current_user, receiver, before_id=None, after_id=None, limit=2):
+    response = get_messages_page(
+        receiver_id=receiver.id,
+        before_id=before_id,
+        after_id=after_id,
+        limit=limit,
+        db=db,
+        current_user=current_user,
+    )
+    body = json.loads(response.body)
+    ids = [message["id"] for message in body["messages"]]
+    if ids:
+        assert (body["oldest_id"], body["newest_id"]) == (ids[0], ids[-1])
+    return ids, body["has_more"]
+
+
+def test_latest_page_and_older_pages(chat):
+    db, ana, ivo, ordered = chat
+
+    assert page(db, ana, ivo) == (ordered[3:], True)
+    assert page(db, ana, ivo, before_id=ordered[3]) == (ordered[1:3], True)
+    assert page(db, ana, ivo, before_id=ordered[1]) == (ordered[:1], False)
+    # Both sides see the same conversation
+    assert page(db, ivo, ana, limit=10) == (ordered, False)
+
+
+def test_newer_pages(chat):
+    db, ana, ivo, ordered = chat
+
+    # Equal timestamps are told apart by id, nothing is skipped or repeated
+    assert page(db, ana, ivo, after_id=ordered[1]) == (ordered[2:4], True)
+    assert page(db, ana, ivo, after_id=ordered[3]) == (ordered[4:], False)
+    assert page(db, ana, ivo, after_id=ordered[4]) == ([], False)
+
+
+def test_before_and_after_together_are_rejected(chat):
+    db, ana, ivo, ordered = chat
+
+    with pytest.raises(HTTPException) as error:
+        page(db, ana, ivo, before_id=ordered[3], after_id=ordered[1])
+    assert error.value.status_code == 400
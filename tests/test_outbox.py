@@ -0,0 +1,224 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+import httpx
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app.connectors import http_clients
+from app.db import ASYNC_SQLALCHEMY_DATABASE_URL
+from app.outbox import (
+    BASEROW_ADD_STUDENT,
+    OutboxWorker,
+    cancel_add_student_jobs,
+    enqueue,
+)
+
+EMAIL = "outbox.student@example.com"
+
+
+class StubBaserow:
+    """
+    Baserow connector stand-in. `add_responses` are returned by successive
+    POST /api/student calls (the last one repeats), `rows` are listed, filtered
+    by email, by GET /api/Student.
+    """
+
+    def __init__(self, add_responses: List[Callable[[], httpx.Response]]):
+        self.add_responses = add_responses
+        self.rows: List[dict] = []
+        self.adds = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET" and request.url.path == "/api/Student":
+            email = request.url.params.get("filter__email__equal")
+            rows = [row for row in self.rows if email is None or row["email"] == email]
+            return httpx.Response(
+                200, json={"data": {"count": len(rows), "results": rows}}
+            )
+        if request.method == "POST" and request.url.path == "/api/student":
+            self.adds += 1
+            response = self.add_responses[min(self.adds, len(self.add_responses)) - 1]()
+            if response.status_code == 200:
+                self.rows.append(response.json()["data"])
+            return response
+        return httpx.Response(404)
+
+
+def added(baserow_id: int) -> Callable[[], httpx.Response]:
+    return lambda: httpx.Response(
+        200, json={"data": {"id": baserow_id, "email": EMAIL}}
+    )
+
+
+def status(code: int) -> Callable[[], httpx.Response]:
+    return lambda: httpx.Response(code, json={"detail": "stub"})
+
+
+def use_baserow(stub: StubBaserow):
+    http_clients.set_client(
+        http_clients.BASEROW,
+        httpx.AsyncClient(
+            transport=httpx.MockTransport(stub.handle),
+            base_url="http://baserow",
+        ),
+    )
+
+
+@pytest.fixture(autouse=True)
+def restore_clients():
+    yield
+    http_clients.set_client(http_clients.BASEROW, None)
+
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+        session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        try:
+            return await scenario(session_factory)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def add_student(session_factory) -> int:
+    async with session_factory() as db:
+        student = models.Student(
+            ime="Outbox",
+            prezime="Student",
+            email=EMAIL,
+            password="x",
+            JMBAG="0000000001",
+        )
+        db.add(student)
+        await db.flush()
+        enqueue(db, BASEROW_ADD_STUDENT, {"student_id": student.id, "data": {"email": EMAIL}})
+        await db.commit()
+        return student.id
+
+
+async def state(session_factory, student_id: int):
+    async with session_factory() as db:
+        baserow_id = await db.scalar(
+            select(models.Student.baserow_id).where(models.Student.id == student_id)
+        )
+        jobs = (await db.execute(select(models.OutboxJob))).scalars().all()
+        return baserow_id, jobs
+
+
+async def make_due(session_factory):
+    async with session_factory() as db:
+        await db.execute(
+            update(models.OutboxJob).values(
+                next_attempt_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+            )
+        )
+        await db.commit()
+
+
+def worker(session_factory) -> OutboxWorker:
+    return OutboxWorker(session_factory=session_factory, base_delay=60, max_delay=60)
+
+
+def test_transient_failure_is_retried(database):
+    stub = StubBaserow([status(503), added(42)])
+    use_baserow(stub)
+
+    async def scenario(session_factory):
+        student_id = await add_student(session_factory)
+
+        assert await worker(session_factory).run_once() == 1
+        baserow_id, [job] = await state(session_factory, student_id)
+        assert (job.status, job.attempts, baserow_id) == ("pending", 1, None)
+        assert job.next_attempt_at > datetime.now(timezone.utc)
+        # Backing off, not claimed again yet
+        assert await worker(session_factory).run_once() == 0
+
+        await make_due(session_factory)
+        assert await worker(session_factory).run_once() == 1
+        baserow_id, [job] = await state(session_factory, student_id)
+        assert (job.status, job.attempts, baserow_id) == ("done", 2, 42)
+
+    run(scenario)
+    assert stub.adds == 2
+
+
+def test_client_error_fails_permanently(database):
+    stub = StubBaserow([status(400)])
+    use_baserow(stub)
+
+    async def scenario(session_factory):
+        student_id = await add_student(session_factory)
+
+        assert await worker(session_factory).run_once() == 1
+        baserow_id, [job] = await state(session_factory, student_id)
+        assert (job.status, job.attempts, baserow_id) == ("failed", 1, None)
+        assert "400" in job.last_error
+
+        await make_due(session_factory)
+        assert await worker(session_factory).run_once() == 0
+
+    run(scenario)
+    assert stub.adds == 1
+
+
+def test_repeated_job_adds_the_student_once(database):
+    stub = StubBaserow([added(42)])
+    use_baserow(stub)
+
+    async def scenario(session_factory):
+        student_id = await add_student(session_factory)
+        assert await worker(session_factory).run_once() == 1
+
+        # Delivered again, e.g. after the lease ran out
+        async with session_factory() as db:
+            await db.execute(update(models.OutboxJob).values(status="pending"))
+            await db.commit()
+        await make_due(session_factory)
+        assert await worker(session_factory).run_once() == 1
+
+        baserow_id, [job] = await state(session_factory, student_id)
+        assert (job.status, baserow_id) == ("done", 42)
+
+    run(scenario)
+    assert stub.adds == 1
+
+
+def test_row_added_by_a_failed_attempt_is_reused(database):
+    # The row was added, but the attempt failed before writing baserow_id
+    stub = StubBaserow([added(43)])
+    stub.rows.append({"id": 42, "email": EMAIL})
+    use_baserow(stub)
+
+    async def scenario(session_factory):
+        student_id = await add_student(session_factory)
+        assert await worker(session_factory).run_once() == 1
+
+        baserow_id, [job] = await state(session_factory, student_id)
+        assert (job.status, baserow_id) == ("done", 42)
+
+    run(scenario)
+    assert stub.adds == 0
+
+
+def test_pending_add_is_cancelled_by_delete(database):
+    stub = StubBaserow([added(42)])
+    use_baserow(stub)
+
+    async def scenario(session_factory):
+        student_id = await add_student(session_factory)
+        async with session_factory() as db:
+            assert len(await cancel_add_student_jobs(db, [student_id])) == 1
+            await db.commit()
+
+        assert await worker(session_factory).run_once() == 0
+        _, [job] = await state(session_factory, student_id)
+        assert job.status == "cancelled"
+
+    run(scenario)
+    assert stub.adds == 0
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+
+from app import models, oauth2
+from app.oauth2 import PrincipalCache
+
+
+def student(user_id: int) -> models.Student:
+    return models.Student(
+        id=user_id,
+        ime="Ana",
+        prezime="Anić",
+        email=f"student{user_id}@example.com",
+        account_type="student",
+        JMBAG=f"{user_id:010}",
+    )
+
+
+def test_put_and_get_return_a_snapshot_of_the_columns():
+    cache = PrincipalCache(max_size=10, ttl=60)
+    key = cache.key("token")
+    cache.put(key, student(1), None)
+
+    model, values = cache.get(key)
+    assert model is models.Student
+    assert values["id"] == 1
+    assert values["email"] == "student1@example.com"
+    assert cache.get(cache.key("other token")) is None
+
+
+def test_entries_expire_after_ttl_or_with_the_token(clock):
+    fake = clock(oauth2)
+    cache = PrincipalCache(max_size=10, ttl=60)
+    cache.put("long", student(1), None)
+    token_expires_at = datetime.fromtimestamp(fake.now + 10, timezone.utc)
+    cache.put("short", student(2), token_expires_at)
+
+    fake.advance(9)
+    assert cache.get("short") is not None
+    fake.advance(1)
+    assert cache.get("short") is None
+    assert cache.get("long") is not None
+    fake.advance(50)
+    assert cache.get("long") is None
+
+
+def test_invalidate_user_drops_all_their_tokens():
+    cache = PrincipalCache(max_size=10, ttl=60)
+    cache.put("phone", student(1), None)
+    cache.put("laptop", student(1), None)
+    cache.put("other", student(2), None)
+
+    cache.invalidate_user(1)
+    assert cache.get("phone") is None
+    assert cache.get("laptop") is None
+    assert cache.get("other") is not None
+
+
+def test_least_recently_used_entries_are_dropped():
+    cache = PrincipalCache(max_size=2, ttl=60)
+    cache.put("a", student(1), None)
+    cache.put("b", student(2), None)
+    cache.get("a")
+    cache.put("c", student(3), None)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
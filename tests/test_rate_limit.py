@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import rate_limit
+from app.rate_limit import (
+    LoginRateLimiter,
+    MemoryBackend,
+    TokenBucketBackend,
+    network_of,
+)
+
+
+def request_from(ip: str):
+    return SimpleNamespace(client=SimpleNamespace(host=ip))
+
+
+def make_limiter(backend) -> LoginRateLimiter:
+    # 1 token per second per IP, one attempt per 10 seconds per email
+    return LoginRateLimiter(
+        backend,
+        ip_burst=2,
+        ip_per_minute=60,
+        email_burst=1,
+        email_per_minute=6,
+    )
+
+
+def retry_after(limiter: LoginRateLimiter, ip: str, email: str) -> str:
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(limiter.check(request_from(ip), email))
+    assert error.value.status_code == 429
+    return error.value.headers["Retry-After"]
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    fake = clock(rate_limit)
+    backend = MemoryBackend(max_keys=10)
+
+    def take() -> float:
+        return asyncio.run(backend.take("key", capacity=3, rate=1))
+
+    assert [take() for _ in range(3)] == [0, 0, 0]
+    assert take() == 1.0
+    fake.advance(0.5)
+    assert take() == 0.5
+    fake.advance(0.5)
+    assert take() == 0
+    fake.advance(10)
+    # Never more than the capacity
+    assert [take() for _ in range(4)] == [0, 0, 0, 1.0]
+
+
+def test_least_recently_used_buckets_are_dropped(clock):
+    clock(rate_limit)
+    backend = MemoryBackend(max_keys=2)
+
+    def take(key: str) -> float:
+        return asyncio.run(backend.take(key, capacity=1, rate=1))
+
+    assert [take("a"), take("b"), take("c")] == [0, 0, 0]
+    # "a" was dropped, so it comes back full, and "b" is dropped in turn
+    assert take("a") == 0
+    assert take("c") > 0
+    assert take("b") == 0
+
+
+def test_ip_bucket_answers_429_with_retry_after(clock):
+    clock(rate_limit)
+    limiter = make_limiter(MemoryBackend(max_keys=10))
+
+    asyncio.run(limiter.check(request_from("10.0.0.1"), "a@example.com"))
+    asyncio.run(limiter.check(request_from("10.0.0.1"), "b@example.com"))
+    assert retry_after(limiter, "10.0.0.1", "c@example.com") == "1"
+    # Other addresses have buckets of their own
+    asyncio.run(limiter.check(request_from("10.0.0.2"), "c@example.com"))
+
+
+def test_email_bucket_is_kept_per_network(clock):
+    fake = clock(rate_limit)
+    limiter = make_limiter(MemoryBackend(max_keys=10))
+
+    asyncio.run(limiter.check(request_from("10.0.0.1"), "a@example.com"))
+    assert retry_after(limiter, "10.0.0.2", " A@Example.com") == "10"
+    # Another /24 isn't locked out of the account
+    asyncio.run(limiter.check(request_from("10.0.1.1"), "a@example.com"))
+
+    fake.advance(10)
+    asyncio.run(limiter.check(request_from("10.0.0.3"), "a@example.com"))
+
+
+def test_network_of():
+    assert network_of("192.168.1.77", 24, 64) == "192.168.1.0/24"
+    assert network_of("2001:db8::1", 24, 64) == "2001:db8::/64"
+    assert network_of("unknown", 24, 64) == "unknown"
+
+
+def test_limiter_can_be_turned_off():
+    limiter = make_limiter(None)
+    for _ in range(10):
+        asyncio.run(limiter.check(request_from("10.0.0.1"), "a@example.com"))
+
+
+def test_backend_errors_fail_open():
+    class BrokenBackend(TokenBucketBackend):
+        async def take(self, key, capacity, rate, cost=1.0):
+            raise ConnectionError("database unavailable")
+
+    limiter = make_limiter(BrokenBackend())
+    for _ in range(10):
+        asyncio.run(limiter.check(request_from("10.0.0.1"), "a@example.com"))
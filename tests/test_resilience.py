@@ -0,0 +1,135 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.connectors import resilience
+from app.connectors.resilience import CircuitBreaker, CircuitOpenError, Upstream
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    clock(resilience)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("test")
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    fake = clock(resilience)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+
+    fake.advance(29.9)
+    assert breaker.state == CircuitBreaker.OPEN
+    fake.advance(0.1)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.before_call("test")
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("test")
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call("test")
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    fake = clock(resilience)
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    fake.advance(30)
+
+    breaker.before_call("test")
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()["retry_in"] == 30
+
+
+def test_abandoned_probe_lets_the_next_call_probe(clock):
+    fake = clock(resilience)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    fake.advance(30)
+
+    breaker.before_call("test")
+    breaker.abandon_probe()
+    breaker.before_call("test")
+
+
+def upstream(**options) -> Upstream:
+    defaults = dict(
+        retries=2,
+        retry_base_delay=0,
+        retry_max_delay=0,
+        failure_threshold=10,
+        reset_timeout=30,
+    )
+    return Upstream("test", **{**defaults, **options})
+
+
+def status_error(code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "http://upstream")
+    return httpx.HTTPStatusError(
+        "error", request=request, response=httpx.Response(code, request=request)
+    )
+
+
+def failing(*errors):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    return fn, calls
+
+
+def test_idempotent_calls_are_retried_on_transient_errors():
+    service = upstream()
+    fn, calls = failing(status_error(503), httpx.ConnectError("down"))
+
+    assert asyncio.run(service.call("op", fn, idempotent=True)) == "ok"
+    assert len(calls) == 3
+
+
+def test_other_calls_are_not_retried():
+    service = upstream()
+    fn, calls = failing(status_error(503))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(service.call("op", fn))
+    assert len(calls) == 1
+
+
+def test_client_errors_are_not_retried_or_counted():
+    service = upstream(failure_threshold=1)
+    fn, calls = failing(status_error(404))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(service.call("op", fn, idempotent=True))
+    assert len(calls) == 1
+    assert service.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_rejects_without_calling():
+    service = upstream(failure_threshold=1, retries=0)
+    fn, calls = failing(status_error(503))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(service.call("op", fn))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(service.call("op", fn))
+    assert len(calls) == 1